@@ -0,0 +1,88 @@
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from tools.results import put_result, flush_results
+from tools.wspr import BAND_DTYPE
+
+# Synthetic fixtures in the layout the pipeline reads, so nothing needs wspr.live or voacapl
+
+BANDS = [1, 3, 5, 7, 10, 14, 18, 21, 24, 28]
+VOACAP_FREQS = [1.84, 3.60, 5.30, 7.10, 10.10, 14.10, 18.10, 21.10, 24.90, 28.20, 50.29]
+VOACAP_FIELDS = ["MODE", "TANGLE", "DELAY", "V HITE", "MUFday", "LOSS", "DBU", "S DBW", "N DBW", "SNR", "RPWRG",
+                 "REL", "MPROB", "S PRB", "SIG LW", "SIG UP", "SNR LW", "SNR UP", "TGAIN", "RGAIN", "SNRxx"]
+
+
+def make_spots(path: Path, band: int, rows: int, month: datetime, seed: int = 0):
+    # One band file as written by tools.wspr._write_bands: a month of spots with an hour dependent SNR
+    rng = np.random.default_rng(seed)
+    start = int(month.replace(tzinfo=timezone.utc).timestamp())
+    spots = np.empty(rows, dtype=BAND_DTYPE)
+    spots["time"] = np.sort(rng.integers(start, start + 28 * 86400, rows))
+    hour = (spots["time"] // 3600) % 24
+    spots["snr"] = np.clip(rng.normal(-15 + 8 * np.sin(hour / 24 * 2 * np.pi), 6).round(), -30, 20)
+    spots["band"] = band
+    spots["frequency"] = int(band * 1_000_000 + 95_000)
+    spots["power"] = 37
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(path, spots)
+    return path
+
+
+def make_voacapx(path: Path, runs: int = 1, seed: int = 0):
+    # voacapx.out with one block per run: a FREQ row per hour followed by every field row
+    rng = np.random.default_rng(seed)
+    lines = []
+    for run in range(runs):
+        lines.append(" IONOSPHERIC COMMUNICATIONS ANALYSIS AND PREDICTION PROGRAM\n")
+        lines.append("                    VOACAP  VERSION 16.1207W\n\n   JAN   2025          SSN =  137.\n\n")
+        for hour in range(1, 25):
+            lines.append(f"{hour:6.1f}{20 + run:5.1f}" + "".join(f"{f:5.1f}" for f in VOACAP_FREQS) + " FREQ\n")
+            for field in VOACAP_FIELDS:
+                if field == "MODE":
+                    lines.append("      1F2" + "  1F2" * len(VOACAP_FREQS) + " MODE\n")
+                elif field == "REL":
+                    lines.append("     " + "".join(f"{v:5.2f}" for v in rng.random(12)) + f" {field}\n")
+                else:
+                    lines.append("     " + "".join(f"{v:5.0f}" for v in rng.uniform(-50, 50, 12)) + f" {field}\n")
+            lines.append("\n")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("".join(lines))
+    return path
+
+
+def make_norms(seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return [
+        {"snr": float(snr), "up": float(up), "lw": float(lw)}
+        for snr, up, lw in zip(rng.normal(-15, 5, 24), rng.uniform(1, 8, 24), rng.uniform(1, 8, 24))
+    ]
+
+
+def make_results(sub_path: str, bands: list[int] = BANDS, neighbors: int = 8, seed: int = 0):
+    # What the stats stage leaves in the results store (formerly TEMP.json) for one circuit-month
+    rng = np.random.default_rng(seed)
+    tx, rx = sub_path.split("/")[0].split("_")
+    put_result(sub_path, "POWER", f"{tx}_{rx}", value=37)
+    for i in range(neighbors):
+        put_result(sub_path, "POWER", f"{tx}_BENCH{i}", value=int(rng.choice([23, 30, 37])))
+        put_result(sub_path, "DIST", f"{rx}_BENCH{i}", value=float(rng.uniform(0, 100)))
+
+    for band in (f"{b:02d}" for b in bands):
+        put_result(sub_path, "WSPR_NORM", band, value=make_norms(seed))
+        put_result(sub_path, "REQ SNR", band, value={"mu": float(rng.normal(-28, 2)), "o": 2.5, "n": 600})
+        rel = {}
+        for name in ("WSPR", "TRUE", "VOACAP", "DIFF", "TRUE DIFF"):
+            values = rng.random(24).tolist()
+            rel[name] = {"avg": float(np.mean(values)), "rel": values}
+        put_result(sub_path, "REL", band, value=rel)
+        for category in ("SINGLE", "GROUP"):
+            put_result(sub_path, "SCORE", category, band, value={
+                "cohen's d": np.sort(rng.normal(0, 1.5, 24)).tolist(),
+                "lvr_up": np.sort(rng.normal(0, 0.5, 24)).tolist(),
+                "lvr_lw": np.sort(rng.normal(0, 0.5, 24)).tolist(),
+            })
+    flush_results(sub_path)
@@ -0,0 +1,166 @@
+import argparse
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.generators import BANDS, make_spots, make_voacapx, make_norms, make_results
+
+# Offline timings of the pipeline hot paths on synthetic fixtures.
+# Usage: python -m benchmarks.run [--spots N] [--neighbors K] [--repeat R] [--save-baseline]
+
+BENCHMARK_PATH: Path = Path(__file__).resolve().parent
+HISTORY_PATH: Path = BENCHMARK_PATH / "history.jsonl"
+BASELINE_PATH: Path = BENCHMARK_PATH / "baseline.json"
+
+MONTH = datetime(2025, 1, 1)
+SUB_PATH = "BENCH_RX/2025_01.00"
+
+
+def make_fixtures(spots: int, neighbors: int, circuits: int):
+    point_path = Path("data/data/point") / SUB_PATH
+    group_path = Path("data/data/group") / SUB_PATH
+    make_voacapx(point_path / "voacapx.out")
+    for i, band in enumerate(BANDS):
+        make_spots(point_path / f"{band:02d}.npy", band, spots, MONTH, seed=i)
+        for n in range(neighbors):
+            make_spots(group_path / f"{band:02d}" / f"BENCH_BENCH{n}.npy", band, spots // 4, MONTH, seed=100 * n + i)
+
+    make_results(SUB_PATH, neighbors=neighbors)
+    for c in range(1, circuits):
+        make_results(f"BENCH_RX{c}/2025_01.00", neighbors=neighbors, seed=c)
+    return point_path, group_path
+
+
+def cases(point_path: Path, group_path: Path):
+    from tools import voacap_extractor
+    from tools.latex import gen_tables
+    from tools.render import configure_render
+    from tools.plots import get_per_hour_distros, calculate_point_score, make_group_plots, plot_errors_bars, \
+        plot_hour_normal_distros, get_difference_nomral
+
+    voacapx = point_path / "voacapx.out"
+    spot_file = point_path / "14.npy"
+    wspr_norm, voacap_norm = make_norms(1), make_norms(2)
+    _, wspr_distro, *_ = get_per_hour_distros(spot_file)
+
+    def parse_cold():
+        voacap_extractor._parse.cache_clear()
+        voacap_extractor.parse_voacapx(voacapx)
+
+    def get_values():
+        voacap_extractor._parse.cache_clear()
+        voacap_extractor.get_values("SNR", voacapx)
+
+    def extract():
+        for field in ("SNR", "SNR UP", "SNR LW", "REL"):
+            voacap_extractor.extract(field, voacapx, band=14)
+
+    def render(mode: str = "publication"):
+        # Without the figure cache, or every repeat after the first would only copy cached files
+        configure_render(mode, cache=False)
+        try:
+            figure_path = Path("data/figures/bench")
+            figure_path.mkdir(parents=True, exist_ok=True)
+            plot_errors_bars(get_difference_nomral(voacap_norm, wspr_norm), wspr_distro, figure_path)
+            plot_hour_normal_distros(wspr_norm, voacap_norm, wspr_distro, figure_path)
+        finally:
+            configure_render()
+
+    return {
+        "parse_voacapx": parse_cold,
+        "get_values": get_values,
+        "extract": extract,
+        "get_per_hour_distros": lambda: get_per_hour_distros(spot_file),
+        "calculate_point_score": lambda: calculate_point_score(wspr_norm, voacap_norm, "14", "SINGLE", SUB_PATH),
+        "make_group_plots": lambda: make_group_plots(group_path, "14", draw=False),
+        "render": render if shutil.which("pdflatex") else None,  # pgf needs a LaTeX install
+        "render_draft": lambda: render("draft"),
+        "gen_tables": gen_tables,
+    }
+
+
+def measure(function, repeat: int):
+    seconds = []
+    for _ in range(repeat):
+        with redirect_stdout(io.StringIO()):  # The stats code prints its tables
+            start = time.perf_counter()
+            function()
+            seconds.append(time.perf_counter() - start)
+    return {"median": statistics.median(seconds), "min": min(seconds), "repeat": repeat}
+
+
+def git_revision():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_PATH, capture_output=True, text=True)
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def report(results: dict, baseline: dict | None):
+    print(f" {"Case":<24}{"Median ms":>11}{"Min ms":>10}{"Baseline":>10}{"Ratio":>8}")
+    for name, result in results.items():
+        if result is None:
+            print(f" {name:<24}{"skipped":>11}")
+            continue
+        base = (baseline or {}).get("cases", {}).get(name)
+        ratio = result["median"] / base["median"] if base else None
+        print(
+            f" {name:<24}{result["median"] * 1000:>11.2f}{result["min"] * 1000:>10.2f}"
+            f"{f"{base["median"] * 1000:.2f}" if base else "-":>10}"
+            f"{f"{ratio:.2f}{" !" if ratio > 1.1 else ""}" if ratio else "-":>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the pipeline hot paths on synthetic data, offline")
+    parser.add_argument("--spots", type=int, default=100_000, help="spots per point band file")
+    parser.add_argument("--neighbors", type=int, default=8, help="group receivers per band")
+    parser.add_argument("--circuits", type=int, default=4, help="circuit-months in the results store")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="*", help="run only these cases")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the comparison baseline")
+    args = parser.parse_args()
+
+    params = {"spots": args.spots, "neighbors": args.neighbors, "circuits": args.circuits}
+    baseline = json.load(open(BASELINE_PATH)) if BASELINE_PATH.exists() else None
+    if baseline and baseline["params"] != params:
+        print(f" Baseline was taken with {baseline["params"]}, ratios are not comparable")
+
+    cwd = os.getcwd()
+    work_path = tempfile.mkdtemp(prefix="wspr_bench_")
+    try:
+        os.chdir(work_path)  # The tools resolve data/ relative to the working directory
+        with redirect_stdout(io.StringIO()):
+            point_path, group_path = make_fixtures(args.spots, args.neighbors, args.circuits)
+            functions = cases(point_path, group_path)
+        results = {
+            name: measure(function, args.repeat) if function else None
+            for name, function in functions.items()
+            if not args.only or name in args.only
+        }
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    report(results, baseline)
+    run = {"time": datetime.now().isoformat(timespec="seconds"), "revision": git_revision(), "params": params,
+           "cases": {name: result for name, result in results.items() if result}}
+    with open(HISTORY_PATH, "a") as file:
+        file.write(json.dumps(run) + "\n")
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w") as file:
+            json.dump(run, file, indent=2)
+        print(f" Baseline saved to {BASELINE_PATH}")
+
+
+if __name__ == "__main__":
+    main()
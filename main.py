@@ -1,27 +1,37 @@
+import argparse
+import io
 import json
-import math
+import multiprocessing
 import os.path
 import shutil
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
 from dateutil.relativedelta import relativedelta
-from timezonefinder import TimezoneFinder
 
-from tools.latex import gen_latex
-from tools.plots import make_point_plots, CAPTIONS, make_group_plots
-from tools.voacap import run_voacap
-from tools.voacap_extractor import extract
-from tools.wspr import wsprlive_get_info, wsprlive_pull_one_month, wsprlive_get_info_group
+from tools.geo import build_receiver_index, receivers_within, nearest_receivers
+from tools.latex import FIGURE_TABLE_PATH, gen_latex
+from tools.manifest import digest, files_digest, code_version, is_fresh, get_meta, mark_built, forget, artifacts, \
+    save_manifest
+from tools.plots import make_point_plots, make_group_plots, spot_files
+from tools.profiling import span, profile_stage, configure, take_profile, merge_profile, write_run_report, \
+    PROFILE_SETTINGS
+from tools.render import CAPTIONS_PATH, load_captions, save_captions, render_queue, configure_render, RENDER_SETTINGS, \
+    figure_cache_evict
+from tools.results import RESULTS_PATH, put_result, flush_results, delete_results, get_results, result_sub_paths, \
+    results_digest
+from tools.timezones import resolve_timezone, save_timezone_cache
+from tools.voacap import run_voacap_pool, build_deck, deck_key
+from tools.voacap_store import write_prediction_store, load_prediction_store, get_prediction
 
 global FROM_DATE, TO_DATE, CONFIG, SSN_DATA
 
 ALPHA: float = 100
-EARTH_LAT: float = 40007.863
-EARTH_LON: float = 40075.017
 
-DATA_TEMP_PATH: Path = Path("data/data/temp")
 DATA_POINT_PATH: Path = Path("data/data/point")
 DATA_GROUP_PATH: Path = Path("data/data/group")
 
@@ -29,39 +39,22 @@ FIGURE_POINT_PATH: Path = Path("data/figures/point")
 FIGURE_GROUP_PATH: Path = Path("data/figures/group")
 
 
-def _r_lat(r: float):
-    return (r * 360) / EARTH_LAT
-
-
-def _r_lon(r: float, rx_lat: float):
-    return (r * 360) / (EARTH_LON * math.cos(math.radians(rx_lat)))
-
-
 def dbw_to_watt(dbw):
     return 10 ** (dbw / 10) / 1000000
 
 
-def haversine(lat1, lon1, lat2, lon2):
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
+@lru_cache
+def _receiver_index(tx, current_datetime):
+    # Receiver locations of a month are fetched once, radius or k can then be changed without a new query
+    from tools.wspr import wsprlive_get_receivers
 
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-
-    # Haversine formula
-    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-
-    # Earth avg radius = 6371 km
-    return 6371 * c
+    return build_receiver_index(wsprlive_get_receivers(tx, current_datetime))
 
 
 def read_configs():
     global FROM_DATE, TO_DATE, CONFIG, SSN_DATA
 
-    SSN_DATA = json.load(open('data/ssn.json'))
+    SSN_DATA = {item['time-tag']: item['ssn'] for item in json.load(open('data/ssn.json'))}
     CONFIG = json.load(open('config.json'))
     time_period = CONFIG['time_period']
 
@@ -69,135 +62,364 @@ def read_configs():
     TO_DATE = datetime.strptime(time_period['to'] + "-01", "%Y-%m-%d").replace(tzinfo=ZoneInfo("UTC"))
 
 
-def one_month(circuit, current_datetime):
-    properties = wsprlive_get_info(circuit, current_datetime)
-    if not properties: return
+def _sub_path(circuit, current_datetime):
+    return f"{circuit["tx"].replace("/", "∕")}_{circuit["rx"].replace("/", "∕")}/{current_datetime.strftime("%Y_%m.00")}"
 
+
+def make_voacap_job(circuit, current_datetime, properties):
     tx_lat = properties['tx_lat']
     tx_lon = properties['tx_lon']
     rx_lat = properties['rx_lat']
     rx_lon = properties['rx_lon']
 
     MONTH = current_datetime.strftime("%Y %m.00")  # .00 is needed for VOACAP config
-    SSN = next((item['ssn'] for item in SSN_DATA if item['time-tag'] == current_datetime.strftime("%Y-%m")))
-    TX, _TX = circuit["tx"], circuit["tx"].replace("/", "∕")
-    RX, _RX = circuit["rx"], circuit["rx"].replace("/", "∕")
+    SSN = SSN_DATA[current_datetime.strftime("%Y-%m")]
+    _TX = circuit["tx"].replace("/", "∕")
+    _RX = circuit["rx"].replace("/", "∕")
     CIRCUIT = f"{abs(tx_lat):05.2f}{'N' if tx_lat >= 0 else 'S'}   {abs(tx_lon):06.2f}{'E' if tx_lon >= 0 else 'W'}    {abs(rx_lat):05.2f}{'N' if rx_lat >= 0 else 'S'}   {abs(rx_lon):06.2f}{'E' if rx_lon >= 0 else 'W'}"
-    NOISE = circuit['noise']
+    NOISE = CONFIG["noise_levels"].get(circuit["noise"])  # Translate noise
     PW = f"{dbw_to_watt(properties['power']) * 0.8:.4f}"  # 80% efficiency, VOACAP online does that
 
-    run_voacap(MONTH, SSN, _TX, _RX, CIRCUIT, NOISE, PW)
-    print()
+    return MONTH, SSN, _TX, _RX, CIRCUIT, NOISE, PW
 
-    sub_path = f"{_TX}_{_RX}/{MONTH.replace(" ", "_")}"
 
-    temp_path = DATA_TEMP_PATH / sub_path
-    temp_path.mkdir(parents=True, exist_ok=True)
-    file_path = temp_path / "TEMP.json"
-    if file_path.exists():
-        with open(file_path, "r") as f:
-            data = json.load(f)
-    else:
-        data = {}
-    data.setdefault("DIST", {})
-    data.setdefault("POWER", {})[f"{_TX}_{_RX}"] = properties['power']
+def one_month(circuit, current_datetime):
+    from tools.wspr import wsprlive_get_info, wsprlive_pull_one_month, wsprlive_pull_many, \
+        wsprlive_pull_hourly_one_month
+
+    properties = wsprlive_get_info(circuit, current_datetime)
+    if not properties: return
+
+    rx_lat = properties['rx_lat']
+    rx_lon = properties['rx_lon']
+
+    TX, _TX = circuit["tx"], circuit["tx"].replace("/", "∕")
+    RX, _RX = circuit["rx"], circuit["rx"].replace("/", "∕")
+
+    sub_path = _sub_path(circuit, current_datetime)
+
+    put_result(sub_path, "POWER", f"{_TX}_{_RX}", value=properties['power'])
 
     # Point to Point
     prefix_path = DATA_POINT_PATH / sub_path
-    local_tz = ZoneInfo("UTC")#ZoneInfo(TimezoneFinder().timezone_at(lat=rx_lat, lng=rx_lon))
-    wsprlive_pull_one_month(TX, RX, current_datetime, local_tz, prefix_path)
+    local_tz = ZoneInfo("UTC")#resolve_timezone(RX, rx_lat, rx_lon)
+    hourly = CONFIG.get("wsprlive_mode", "raw") == "hourly"  # Server side per hour SNR histograms
+    json_export = CONFIG.get("spot_json", False)  # Also write the band files as JSON next to the .npy ones
+    if hourly:
+        wsprlive_pull_hourly_one_month(TX, RX, current_datetime, local_tz, prefix_path)
+    else:
+        wsprlive_pull_one_month(TX, RX, current_datetime, local_tz, prefix_path, json_export=json_export)
 
     print(" Point pull done!\n")
 
-    # Point to Group
-    r = ALPHA  # * math.sqrt(properties["distance"])
-    r_lat = _r_lat(r)
-    r_long = _r_lon(r, rx_lat)
+    # Point to Group, great-circle neighborhood of rx: within a radius, or the k nearest receivers
+    r = CONFIG.get("group_radius", ALPHA)  # * math.sqrt(properties["distance"])
+    k = CONFIG.get("group_k")
 
     prefix_path = DATA_GROUP_PATH / sub_path
-    group = wsprlive_get_info_group(circuit, current_datetime, rx_lat, rx_lon, r_lat, r_long)
+    index = _receiver_index(TX, current_datetime)
+    if k:
+        group = nearest_receivers(index, rx_lat, rx_lon, k, exclude=RX)
+    else:
+        group = receivers_within(index, rx_lat, rx_lon, r, exclude=RX)
+    pulls = []
     for point in group:
         _rx = point["rx_sign"].replace("/", "∕")
-        data["DIST"][f"{_RX}_{_rx}"] = haversine(rx_lat, rx_lon, point["rx_lat"], point["rx_lon"])
-        data["POWER"][f"{_TX}_{_rx}"] = point['power']
+        put_result(sub_path, "DIST", f"{_RX}_{_rx}", value=point["distance"])
+        put_result(sub_path, "POWER", f"{_TX}_{_rx}", value=point['power'])
 
         suffix_path = f"/{_TX}_{_rx}"
-        local_tz = ZoneInfo(TimezoneFinder().timezone_at(lat=point["rx_lat"], lng=point["rx_lon"]))
-        wsprlive_pull_one_month(TX, point["rx_sign"], current_datetime, local_tz, prefix_path, suffix_path)
+        local_tz = resolve_timezone(point["rx_sign"], point["rx_lat"], point["rx_lon"])
+        pulls.append((TX, point["rx_sign"], current_datetime, local_tz, prefix_path, suffix_path))
+    wsprlive_pull_many(pulls, CONFIG.get("wsprlive_concurrency", 8), hourly=hourly, json_export=json_export)
 
-    with open(file_path, "w") as f:
-        json.dump(data, f, indent=2)
+    # One transaction per circuit-month, parallel workers never see a half written month
+    flush_results(sub_path, replace=[("POWER",), ("DIST",)])
+    save_timezone_cache()
     print(" Group pull done!\n")
 
+    return properties
 
-def prep_data():
-    #if os.path.exists(DATA_TEMP_PATH): shutil.rmtree(DATA_TEMP_PATH)
-    if os.path.exists(DATA_POINT_PATH): shutil.rmtree(DATA_POINT_PATH)
-    if os.path.exists(DATA_GROUP_PATH): shutil.rmtree(DATA_GROUP_PATH)
 
-    for circuit in CONFIG["circuits"]:
-        circuit["noise"] = CONFIG["noise_levels"].get(circuit["noise"])  # Translate noise
+def _traced_one_month(circuit, current_datetime):
+    with span("fetch", circuit=_sub_path(circuit, current_datetime)):
+        return one_month(circuit, current_datetime)
+
+
+def _init_fetch_worker(memory: bool):
+    read_configs()
+    configure(memory=memory)
+
+
+def _one_month_task(circuit, current_datetime):
+    # Runs in a worker process, console output is captured and handed back to be printed in order
+    from tools.wspr import WSPRLIVE_STATS
+
+    WSPRLIVE_STATS.clear()
+    output = io.StringIO()
+    with redirect_stdout(output):
+        properties = _traced_one_month(circuit, current_datetime)
+    return properties, output.getvalue(), dict(WSPRLIVE_STATS), take_profile()
+
+
+def _prune(root: Path, keep: set[str], prefix: str, results: bool = False):
+    # Drop outputs of circuit-months that are no longer in config.json
+    for path in [p for p in root.glob("*/*") if p.is_dir()]:
+        sub_path = str(path.relative_to(root))
+        if sub_path not in keep:
+            shutil.rmtree(path)
+            forget(f"{prefix}:{sub_path}")
+
+    # With results, their rows too, also of circuit-months whose dirs went missing some other way
+    if results:
+        for sub_path in set(result_sub_paths()) - keep:
+            delete_results(sub_path)
+
+    # Circuits left without a month would still get a section in the LaTeX imports
+    for path in [p for p in root.glob("*") if p.is_dir() and not any(p.iterdir())]:
+        path.rmdir()
+
 
+def _prune_bands(sub_path: Path, bands: set[str], results: dict, draw: bool):
+    # Bands whose group spots are gone keep neither their figure, their manifest entries nor their scores
+    if draw:
+        for path in (FIGURE_GROUP_PATH / sub_path).glob("error_*"):
+            if path.stem.removeprefix("error_") not in bands: path.unlink()
+    for artifact in artifacts(f"group:{sub_path}/") + artifacts(f"stats:group:{sub_path}/"):
+        if artifact.rsplit("/", 1)[1] not in bands: forget(artifact)
+    gone = [("SCORE", "GROUP", band) for band in results.get("SCORE", {}).get("GROUP", {}) if band not in bands]
+    if gone: delete_results(sub_path, *gone)
+
+
+def _tasks():
+    tasks = []
+    for circuit in CONFIG["circuits"]:
         current_datetime = FROM_DATE
         while current_datetime <= TO_DATE:
-            one_month(circuit, current_datetime)
+            tasks.append((circuit, current_datetime))
             current_datetime += relativedelta(months=1)
+    return tasks
+
+
+def fetch(jobs: int = 1):
+    from tools.wspr import wsprlive_report, merge_wsprlive_stats, month_closed
+
+    tasks = _tasks()
+    sub_paths = [_sub_path(circuit, current_datetime) for circuit, current_datetime in tasks]
+    _prune(DATA_POINT_PATH, set(sub_paths), "fetch", results=True)
+    _prune(DATA_GROUP_PATH, set(sub_paths), "fetch")
+
+    # Only months that are still open or whose query inputs changed
+    code = code_version("main.py", "tools/wspr.py", "tools/timezones.py", "tools/geo.py")
+    settings = [CONFIG.get("group_radius", ALPHA), CONFIG.get("group_k"), CONFIG.get("wsprlive_mode"), CONFIG.get("spot_json")]
+    fetch_keys = {
+        sub_path: digest(circuit["tx"], circuit["rx"], current_datetime, settings, code)
+        for (circuit, current_datetime), sub_path in zip(tasks, sub_paths)
+    }
+    stale = [
+        (task, sub_path) for task, sub_path in zip(tasks, sub_paths)
+        if not month_closed(task[1]) or not is_fresh(f"fetch:{sub_path}", fetch_keys[sub_path])
+        or (get_meta(f"fetch:{sub_path}") and not (DATA_POINT_PATH / sub_path).exists())
+    ]
+    print(f" Fetching {len(stale)} of {len(tasks)} circuit-months\n")
+    for _, sub_path in stale:
+        shutil.rmtree(DATA_POINT_PATH / sub_path, ignore_errors=True)
+        shutil.rmtree(DATA_GROUP_PATH / sub_path, ignore_errors=True)
+
+    if jobs <= 1 or len(stale) <= 1:
+        fetched = [_traced_one_month(circuit, current_datetime) for (circuit, current_datetime), _ in stale]
+    else:
+        fetched = []
+        context = multiprocessing.get_context("spawn")
+        initargs = (PROFILE_SETTINGS["memory"],)
+        with ProcessPoolExecutor(min(jobs, len(stale)), mp_context=context, initializer=_init_fetch_worker, initargs=initargs) as executor:
+            for properties, output, stats, profile in executor.map(_one_month_task, *zip(*[task for task, _ in stale])):
+                print(output, end="")
+                merge_wsprlive_stats(stats)
+                merge_profile(profile)
+                fetched.append(properties)
+
+    # Receiver info is kept in the manifest, so simulate can run without fetching again
+    for (_, sub_path), properties in zip(stale, fetched):
+        mark_built(f"fetch:{sub_path}", fetch_keys[sub_path], properties)
+    save_manifest()
+
+    with open(Path("data/wsprlive_stats.json"), "w") as file:
+        json.dump(wsprlive_report(), file, indent=2)
+    print()
+
 
+def simulate():
+    # Only circuit-months whose deck (SSN, noise, location, power) changed
+    voacap_jobs = []
+    for circuit, current_datetime in _tasks():
+        sub_path = _sub_path(circuit, current_datetime)
+        properties = get_meta(f"fetch:{sub_path}")
+        if not properties: continue
+        voacap_job = make_voacap_job(circuit, current_datetime, properties)
+        key = deck_key(build_deck(*voacap_job))
+        if not is_fresh(f"voacap:{sub_path}", key, DATA_POINT_PATH / sub_path / "voacapx.out"):
+            voacap_jobs.append((voacap_job, sub_path, key))
+
+    # Each worker gets its own itshfbc overlay, so predictions run one per core
+    run_voacap_pool([voacap_job for voacap_job, _, _ in voacap_jobs], CONFIG.get("voacap_workers", os.cpu_count()))
+    for _, sub_path, key in voacap_jobs:
+        mark_built(f"voacap:{sub_path}", key)
+    save_manifest()
+    write_prediction_store()
+    print()
 
-def plot_point():
-    if os.path.exists(FIGURE_POINT_PATH): shutil.rmtree(FIGURE_POINT_PATH)
 
-    print("\n Plotting for point...")
+def prep_data(jobs: int = 1):
+    fetch(jobs)
+    simulate()
+
+
+def plot_point(draw: bool = True, workers: int = 1):
+    # Without draw only the statistics in the results store are computed, matplotlib is never loaded
+    load_captions()
+    print(f"\n {"Plotting" if draw else "Statistics"} for point...")
+    store = load_prediction_store()
+    code = code_version("tools/plots.py", "tools/voacap_extractor.py", "tools/voacap_store.py")
     dirs = sorted([p for p in DATA_POINT_PATH.glob("*/*") if p.is_dir()])
-    for path in dirs:
-        voacapx = path / "voacapx.out"
-        print(f" Going through: {path}")
-
-        bands = sorted(path.glob("*.json"))
-        for band_path in bands:
-            band = int(band_path.stem)
-            print(f"\tPlotting for band: {band}")
-
-            snr = [d["value"] for d in extract("SNR", voacapx, band=band)]
-            snrup = [d["value"] for d in extract("SNR UP", voacapx, band=band)]
-            snrlw = [d["value"] for d in extract("SNR LW", voacapx, band=band)]
-            rel = [d["value"] for d in extract("REL", voacapx, band=band)]
-
-            # Compensate for 1-24 hour to 00:00-23:00 hour conversion
-            snr = [snr[-1]] + snr[:-1]
-            snrup = [snrup[-1]] + snrup[:-1]
-            snrlw = [snrlw[-1]] + snrlw[:-1]
-            rel = [rel[-1]] + rel[:-1]
-
-            make_point_plots(path, f"{band:02d}", snr, snrup, snrlw, rel)
-        print()
-    with open(Path("data/captions.json"), "w") as file:
-        json.dump(CAPTIONS, file, indent=2)
+    if draw: _prune(FIGURE_POINT_PATH, {str(path.relative_to(DATA_POINT_PATH)) for path in dirs}, "point")
+    built = []  # Marked once the queued figures are drawn
+    unsimulated = []
+    with render_queue(workers):
+        for path in dirs:
+            sub_path = path.relative_to(DATA_POINT_PATH)
+            if not (path / "voacapx.out").exists():
+                # Refetched but not simulated yet, stays dirty until simulate has run
+                unsimulated.append(str(sub_path))
+                continue
+            bands = spot_files(path.glob("*"), r"-?\d+")
+            key = digest(files_digest([path / "voacapx.out", *bands.values()]), code, RENDER_SETTINGS if draw else None)
+            artifact, outputs = (f"point:{sub_path}", [FIGURE_POINT_PATH / sub_path]) if draw else \
+                (f"stats:point:{sub_path}", [])
+            if is_fresh(artifact, key, *outputs, RESULTS_PATH):
+                print(f" Up to date: {path}")
+                continue
+
+            print(f" Going through: {path}")
+            if draw: shutil.rmtree(FIGURE_POINT_PATH / sub_path, ignore_errors=True)
+            freqs, fields, voacap = get_prediction(store, path.parent.name, path.name)  # Hours already 00:00-23:00 UTC
+
+            for band_path in bands.values():
+                band = int(band_path.stem)
+                if band not in freqs: continue
+                print(f"\t{"Plotting" if draw else "Statistics"} for band: {band}")
+
+                snr, snrup, snrlw, rel = (
+                    voacap[:, freqs.index(band), fields.index(field)].tolist()
+                    for field in ("SNR", "SNR UP", "SNR LW", "REL")
+                )
+
+                make_point_plots(path, f"{band:02d}", snr, snrup, snrlw, rel, draw)
+            if draw: (FIGURE_POINT_PATH / sub_path).mkdir(parents=True, exist_ok=True)
+            flush_results(sub_path, replace=[("REQ SNR",), ("REL",), ("WSPR_NORM",), ("SCORE", "SINGLE")])
+            built.append((artifact, key))
+            print()
+    for artifact, key in built:
+        mark_built(artifact, key)
+    save_manifest()
+    save_captions()
+    if draw: figure_cache_evict()
+    if unsimulated:
+        print(f" \033[91mNo VOACAP prediction for {", ".join(unsimulated)}, run `python main.py simulate` first\033[0m")
     # magic()
 
 
-def plot_group():
-    if os.path.exists(FIGURE_GROUP_PATH): shutil.rmtree(FIGURE_GROUP_PATH)
-
-    print("\n Plotting for group...")
+def plot_group(draw: bool = True, workers: int = 1):
+    load_captions()
+    print(f"\n {"Plotting" if draw else "Statistics"} for group...")
+    code = code_version("tools/plots.py")
     dirs = sorted([p for p in DATA_GROUP_PATH.glob("*/*") if p.is_dir()])
-    for path in dirs:
-        print(f" Going through: {path}")
-        bands = sorted(path.glob("*"))
-        for band_path in bands:
-            print(f"\tPlotting for band: {int(band_path.name)}")
-            make_group_plots(path, band_path.name)
-        print()
-    with open(Path("data/captions.json"), "w") as file:
-        json.dump(CAPTIONS, file, indent=2)
+    if draw: _prune(FIGURE_GROUP_PATH, {str(path.relative_to(DATA_GROUP_PATH)) for path in dirs}, "group")
+    built = []  # Marked once the queued figures are drawn
+    with render_queue(workers):
+        for path in dirs:
+            sub_path = path.relative_to(DATA_GROUP_PATH)
+            results = get_results(sub_path)
+            print(f" Going through: {path}")
+            bands = sorted(path.glob("*"))
+            _prune_bands(sub_path, {band_path.name for band_path in bands}, results, draw)
+            rebuilt = []
+            for band_path in bands:
+                # Group figures depend on the point statistics as well as on the group spots
+                inputs = [results.get("WSPR_NORM", {}).get(band_path.name), results.get("POWER"), results.get("DIST")]
+                key = digest(inputs, files_digest(sorted(band_path.glob("*"))), code, RENDER_SETTINGS if draw else None)
+                artifact, outputs = (f"group:{sub_path}/{band_path.name}", [FIGURE_GROUP_PATH / sub_path]) if draw \
+                    else (f"stats:group:{sub_path}/{band_path.name}", [RESULTS_PATH])
+                if is_fresh(artifact, key, *outputs):
+                    print(f"\tUp to date: {int(band_path.name)}")
+                    continue
+
+                print(f"\t{"Plotting" if draw else "Statistics"} for band: {int(band_path.name)}")
+                if draw:  # A band that ends up with no beacon to plot must not keep its old figure
+                    for suffix in (".pdf", ".png"):
+                        (FIGURE_GROUP_PATH / sub_path / f"error_{band_path.name}{suffix}").unlink(missing_ok=True)
+                make_group_plots(path, band_path.name, draw)
+                rebuilt.append(("SCORE", "GROUP", band_path.name))
+                if draw: (FIGURE_GROUP_PATH / sub_path).mkdir(parents=True, exist_ok=True)
+                built.append((artifact, key))
+            flush_results(sub_path, replace=rebuilt)
+            print()
+    for artifact, key in built:
+        mark_built(artifact, key)
+    save_manifest()
+    save_captions()
+    if draw: figure_cache_evict()
+
+
+def make_latex():
+    _prune(FIGURE_TABLE_PATH, {str(p.relative_to(DATA_POINT_PATH)) for p in DATA_POINT_PATH.glob("*/*") if p.is_dir()},
+           "table")
+    figures = sorted(str(path) for path in Path("data/figures").rglob("*.pdf"))
+    key = digest(figures, files_digest([CAPTIONS_PATH]), results_digest(), code_version("tools/latex.py"))
+    if is_fresh("latex", key, Path("data/import_point_figures.tex"), Path("data/import_group_figures.tex")):
+        print(" LaTeX up to date")
+        return
+    gen_latex()
+    mark_built("latex", key)
+    save_manifest()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Fetch WSPR data, simulate it with VOACAP and plot a comparison")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="circuit-months fetched in parallel")
+    parser.add_argument("--render-jobs", type=int, default=os.cpu_count(), help="figures drawn in parallel")
+    parser.add_argument("--draft", action="store_true", help="draw figures with Agg and mathtext instead of pgf/LaTeX")
+    parser.add_argument("--profile", action="store_true", help="dump a cProfile per stage into data/profile")
+    parser.add_argument("--trace-memory", action="store_true", help="record tracemalloc peaks per span")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("all", help="run every stage (default)")
+    commands.add_parser("fetch", help="pull spots and receiver info from wspr.live")
+    commands.add_parser("simulate", help="run VOACAP for the fetched circuit-months")
+    commands.add_parser("stats", help="compute statistics into the results store without drawing figures")
+    commands.add_parser("plot", help="compute statistics and draw the point and group figures")
+    commands.add_parser("latex", help="generate the LaTeX figure imports and tables")
+    args = parser.parse_args()
+    command = args.command or "all"
+
     read_configs()
-    prep_data()
-    plot_point()
-    plot_group()
-    gen_latex()
+    configure(memory=args.trace_memory, cprofile=args.profile)
+    configure_render("draft" if args.draft else CONFIG.get("render_mode", "publication"), CONFIG.get("draft_png_dpi"),
+                     CONFIG.get("figure_cache", True))
+    if command in ("all", "fetch"):
+        with profile_stage("fetch"): fetch(args.jobs)
+    if command in ("all", "simulate"):
+        with profile_stage("simulate"): simulate()
+    if command == "stats":
+        with profile_stage("stats"):
+            plot_point(draw=False)
+            plot_group(draw=False)
+    if command in ("all", "plot"):
+        with profile_stage("plot"):
+            plot_point(workers=args.render_jobs)
+            plot_group(workers=args.render_jobs)
+    if command in ("all", "latex"):
+        with profile_stage("latex"): make_latex()
+    write_run_report()
 
     print(" Done!")
 
@@ -0,0 +1,52 @@
+import numpy as np
+
+EARTH_RADIUS: float = 6371  # Earth avg radius in km
+
+
+def to_xyz(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def build_receiver_index(receivers: list[dict]):
+    from scipy.spatial import cKDTree
+
+    # One location per receiver, the first one reported in the month wins (rows come ordered by rx_sign, first_seen)
+    unique = {}
+    for receiver in receivers:
+        unique.setdefault(receiver["rx_sign"], receiver)
+    receivers = list(unique.values())
+
+    lat = np.array([r["rx_lat"] for r in receivers], dtype=np.float64)
+    lon = np.array([r["rx_lon"] for r in receivers], dtype=np.float64)
+    # Points on the unit sphere, so the straight line distance is monotonic in the great-circle distance
+    return {"receivers": receivers, "lat": lat, "lon": lon, "tree": cKDTree(to_xyz(lat, lon).reshape(-1, 3))}
+
+
+def _neighbors(index: dict, lat: float, lon: float, rows, exclude: str | None):
+    rows = np.asarray(rows, dtype=np.int64)
+    distances = haversine(lat, lon, index["lat"][rows], index["lon"][rows])
+    order = np.argsort(distances, kind="stable")
+    return [
+        {**index["receivers"][row], "distance": float(distance)}
+        for row, distance in zip(rows[order], distances[order])
+        if index["receivers"][row]["rx_sign"] != exclude
+    ]
+
+
+def receivers_within(index: dict, lat: float, lon: float, radius: float, exclude: str | None = None):
+    chord = 2 * np.sin(min(radius / EARTH_RADIUS, np.pi) / 2)
+    return _neighbors(index, lat, lon, index["tree"].query_ball_point(to_xyz(lat, lon), chord), exclude)
+
+
+def nearest_receivers(index: dict, lat: float, lon: float, k: int, exclude: str | None = None):
+    n = len(index["receivers"])
+    if n == 0 or k <= 0: return []
+    _, rows = index["tree"].query(to_xyz(lat, lon), k=[i + 1 for i in range(min(k + 1, n))])
+    return _neighbors(index, lat, lon, rows, exclude)[:k]
@@ -5,7 +5,7 @@ from itertools import zip_longest
 
 import numpy as np
 
-DATA_TEMP_PATH: Path = Path("data/data/temp")
+from tools.results import result_sub_paths, get_results
 
 FIGURE_TABLE_PATH: Path = Path("data/figures/table")
 FIGURE_POINT_PATH: Path = Path("data/figures/point")
@@ -350,25 +350,22 @@ def gen_score(SCORE, path: Path):
 
 
 def gen_tables():
-    beacon_dirs = sorted([p for p in DATA_TEMP_PATH.glob("*") if p.is_dir()])
-    for beacon_path in beacon_dirs:
-        month_dirs = sorted([p for p in beacon_path.glob("*") if p.is_dir()])
-        for month_path in month_dirs:
-            table_path_single = FIGURE_TABLE_PATH / month_path.relative_to(month_path.parent.parent) / "SINGLE"
-            table_path_group = FIGURE_TABLE_PATH / month_path.relative_to(month_path.parent.parent) / "GROUP"
-            table_path_single.mkdir(parents=True, exist_ok=True)
-            table_path_group.mkdir(parents=True, exist_ok=True)
-
-            data = json.load(open(month_path / "TEMP.json"))
-            gen_req_snr(data["REQ SNR"], table_path_single)
-            gen_rel(data["REL"], "WSPR", "DIFF", table_path_single)
-            gen_rel(data["REL"], "TRUE", "TRUE DIFF", table_path_single, name=True)
-            print("Single")
-            gen_score(data["SCORE"]["SINGLE"], table_path_single)
-            print()
-            print("Group")
-            gen_score(data["SCORE"]["GROUP"], table_path_group)
-            print()
+    for sub_path in result_sub_paths():
+        table_path_single = FIGURE_TABLE_PATH / sub_path / "SINGLE"
+        table_path_group = FIGURE_TABLE_PATH / sub_path / "GROUP"
+        table_path_single.mkdir(parents=True, exist_ok=True)
+        table_path_group.mkdir(parents=True, exist_ok=True)
+
+        data = get_results(sub_path)
+        gen_req_snr(data["REQ SNR"], table_path_single)
+        gen_rel(data["REL"], "WSPR", "DIFF", table_path_single)
+        gen_rel(data["REL"], "TRUE", "TRUE DIFF", table_path_single, name=True)
+        print("Single")
+        gen_score(data["SCORE"]["SINGLE"], table_path_single)
+        print()
+        print("Group")
+        gen_score(data["SCORE"]["GROUP"], table_path_group)
+        print()
 
 
 def gen_latex():
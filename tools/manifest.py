@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+# Records, per artifact, a digest of everything it was built from. A stage only rebuilds artifacts whose
+# inputs digest changed or whose output went missing, like make.
+MANIFEST_PATH: Path = Path("data/manifest.json")
+
+_manifest: dict[str, dict] | None = None
+_file_digests: dict[tuple[str, int, int], str] = {}
+
+
+def _load():
+    global _manifest
+    if _manifest is None:
+        _manifest = json.load(open(MANIFEST_PATH)) if MANIFEST_PATH.exists() else {}
+    return _manifest
+
+
+def digest(*inputs):
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def file_digest(path: Path):
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    if key not in _file_digests:
+        with open(path, "rb") as file:
+            _file_digests[key] = hashlib.file_digest(file, "sha256").hexdigest()
+    return _file_digests[key]
+
+
+def files_digest(paths):
+    return digest(sorted((str(path), file_digest(path)) for path in paths))
+
+
+def code_version(*paths: str):
+    return files_digest(Path(path) for path in paths)
+
+
+def is_fresh(artifact: str, key: str, *outputs: Path):
+    entry = _load().get(artifact)
+    return entry is not None and entry["key"] == key and all(output.exists() for output in outputs)
+
+
+def get_meta(artifact: str):
+    entry = _load().get(artifact)
+    return entry.get("meta") if entry else None
+
+
+def mark_built(artifact: str, key: str, meta=None):
+    _load()[artifact] = {"key": key, "meta": meta}
+
+
+def artifacts(prefix: str):
+    return [a for a in _load() if a.startswith(prefix)]
+
+
+def forget(prefix: str):
+    for artifact in [a for a in _load() if a.startswith(prefix)]:
+        del _manifest[artifact]
+
+
+def save_manifest():
+    if _manifest is None: return
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = MANIFEST_PATH.with_suffix(f".{os.getpid()}.tmp")
+    with open(temp_path, "w") as file:
+        json.dump(_manifest, file, indent=2, sort_keys=True)
+    os.replace(temp_path, MANIFEST_PATH)
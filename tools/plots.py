@@ -1,77 +1,214 @@
 import json
 import calendar
-from collections import Counter
-from datetime import datetime
+import re
+from datetime import datetime, timezone
+from functools import cache
 from pathlib import Path
 
-import matplotlib as mpl
-import matplotlib.pyplot as plt
 import numpy as np
-from scipy.stats import norm
 
-mpl.use("pgf")
-plt.rcParams.update({
-    "pgf.texsystem": "pdflatex",  # sudo apt install texlive-full
-    "font.family": "serif",  # use LaTeX serif font
-    "font.size": 11,
-    "text.usetex": True,  # use LaTeX to render text
-    "pgf.rcfonts": False,  # don’t override Matplotlib defaults
-})
+from tools.manifest import code_version
+from tools.profiling import span, count
+from tools.render import set_caption, submit, RENDER_SETTINGS
+from tools.results import put_result, get_results
 
 SNR_OFFSET = 34  # SNR offset to compensate for bandwidth differences between VOACAP and WSPR
 REQ_SNR = 3 - SNR_OFFSET
 HOURS = range(24)
 
-DATA_TEMP_PATH: Path = Path("data/data/temp")
-
 FIGURE_POINT_PATH: Path = Path("data/figures/point")
 FIGURE_GROUP_PATH: Path = Path("data/figures/group")
 FIGURE_TABLE_PATH: Path = Path("data/figures/table")
 
-CAPTIONS = {}
+RC_PARAMS = {
+    "publication": {
+        "pgf.texsystem": "pdflatex",  # sudo apt install texlive-full
+        "font.family": "serif",  # use LaTeX serif font
+        "font.size": 11,
+        "text.usetex": True,  # use LaTeX to render text
+        "pgf.rcfonts": False,  # don’t override Matplotlib defaults
+    },
+    # Same figures through Agg and the PDF backend, with mathtext instead of a pdflatex run per figure
+    "draft": {
+        "font.family": "serif",
+        "font.size": 11,
+        "text.usetex": False,
+        "mathtext.fontset": "cm",  # Computer Modern, close to the LaTeX output
+    },
+}
 
 
-def get_per_hour_distros(path: Path):
-    data = json.load(open(path))
+# Render mode whose backend and rcParams pyplot currently has
+_active_mode: str | None = None
+
+
+def _pyplot():
+    global _active_mode
+    plt = _load_pyplot()
+    mode = RENDER_SETTINGS["mode"]
+    if mode != _active_mode:
+        import matplotlib as mpl
+
+        mpl.rc_file_defaults()  # Nothing of the previous mode is left over, e.g. text.usetex
+        mpl.use("Agg" if mode == "draft" else "pgf")
+        plt.rcParams.update(RC_PARAMS[mode])
+        _active_mode = mode
+    return plt
 
+
+@cache
+def _load_pyplot():
+    # matplotlib (and the pgf backend) is only loaded once a figure is actually drawn
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _submit(output: Path, function, *args):
+    # Figures are cached on their arguments, this file and the rcParams of the render mode
+    submit(output, function, *args, version=[code_version(__file__), RC_PARAMS[RENDER_SETTINGS["mode"]]])
+
+
+def _save(fig, path: Path):
+    fig.savefig(path)
+    if RENDER_SETTINGS["png_dpi"]: fig.savefig(path.with_suffix(".png"), dpi=RENDER_SETTINGS["png_dpi"])
+    count("figures")
+    _pyplot().close(fig)
+
+
+def _grouped_percentile(values: np.ndarray, cum: np.ndarray, first: np.ndarray, sizes: np.ndarray, q: float):
+    # np.percentile (linear method) of every group at once. values/cum are the sorted distinct values and the
+    # running spot count over all groups, first/sizes the offset and spot count of each group in that run
+    if not len(values): return np.full(len(sizes), np.nan)
+    virtual = np.maximum(sizes - 1, 0) * (q / 100)
+    previous = np.floor(virtual).astype(np.int64)
+    following = np.minimum(previous + 1, np.maximum(sizes - 1, 0))
+    gamma = virtual - previous
+
+    a = values[np.minimum(np.searchsorted(cum, first + previous, side="right"), len(values) - 1)]
+    b = values[np.minimum(np.searchsorted(cum, first + following, side="right"), len(values) - 1)]
+    diff = b - a
+    return np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma)
+
+
+def _histograms(groups: np.ndarray, snrs: np.ndarray, counts: np.ndarray | None, n_groups: int):
+    # One histogram for all groups: distinct (group, snr) keys come out of np.unique sorted by group, then snr
+    groups = np.asarray(groups, dtype=np.int64)
+    snrs = np.asarray(snrs, dtype=np.int64)
+    counts = np.ones(len(snrs), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+    low = int(snrs.min()) if len(snrs) else 0
+    width = int(snrs.max()) - low + 1 if len(snrs) else 1
+    keys, inverse = np.unique(groups * width + (snrs - low), return_inverse=True)
+    weights = np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+    key_groups, values = keys // width, keys % width + low
+
+    sizes = np.bincount(key_groups, weights=weights, minlength=n_groups).astype(np.int64)
+    cum = np.cumsum(weights)
+    first = np.cumsum(sizes) - sizes
+    percentiles = [_grouped_percentile(values, cum, first, sizes, q) for q in (1, 10, 50, 90)]
+    return key_groups, values, weights, sizes, percentiles
+
+
+def _hour_distros(hours: np.ndarray, snrs: np.ndarray, counts: np.ndarray | None, days_count: int, samples: int):
     normal: list[dict[str, float]] = []
     distro: list[dict[str, list[float] | int]] = []
     req_snr: list[float] = []
     rel: list[float] = []
 
-    date = datetime.strptime(data[0]["time"], "%Y-%m-%d %H:%M:%S")
-    (_, days_count) = calendar.monthrange(date.year, date.month)
-    times = sorted(datetime.strptime(entry["time"], "%Y-%m-%d %H:%M:%S") for entry in data)
     min_diff = 2 #0 if len(times) < 2 else min((t2 - t1).total_seconds() for t1, t2 in zip(times, times[1:])) / 60
     total = np.divide((days_count * 60), min_diff)
     print("True REL total:", total)
 
+    key_hours, values, weights, sizes, (p1, p10, p50, p90) = _histograms(hours, snrs, counts, len(HOURS))
+    bounds = np.searchsorted(key_hours, np.arange(len(HOURS) + 1))
+
     for H in HOURS:
-        snr_hour = sorted([
-            entry["snr"]
-            for entry
-            in data
-            if datetime.strptime(entry["time"], "%Y-%m-%d %H:%M:%S").hour == H
-        ])
-        size = len(snr_hour)
+        size = int(sizes[H])
         rel.append(np.divide(size, total))
 
         if size >= 1:
-            median = float(np.percentile(snr_hour, 50))
-            o_up = abs(median - float(np.percentile(snr_hour, 90))) / 1.28
-            o_lw = abs(median - float(np.percentile(snr_hour, 10))) / 1.28
+            median = float(p50[H])
+            o_up = abs(median - float(p90[H])) / 1.28
+            o_lw = abs(median - float(p10[H])) / 1.28
             normal.append({"snr": median, "up": o_up, "lw": o_lw})
 
-            snr, count = zip(*Counter(snr_hour).items())
-            distro.append({"snr": list(snr), "p": [c / size for c in count], "size": size})
+            s, e = bounds[H], bounds[H + 1]
+            distro.append({"snr": values[s:e].tolist(), "p": [c / size for c in weights[s:e].tolist()], "size": size})
 
-            req_snr.append(float(np.percentile(snr_hour, 1)))
+            req_snr.append(float(p1[H]))
         else:
             normal.append({"snr": np.nan, "up": np.nan, "lw": np.nan})
             distro.append({"snr": [], "p": [], "size": size})
             req_snr.append(np.nan)
 
-    return normal, distro, req_snr, rel, len(data)
+    return normal, distro, req_snr, rel, samples
+
+
+def spot_files(paths, pattern: str = r".+"):
+    # Band files by stem, the columnar .npy wins over an exported .json of the same spots
+    files = {}
+    for path in sorted(paths):
+        if path.suffix not in (".npy", ".json") or not re.fullmatch(pattern, path.stem): continue
+        if path.stem not in files or path.suffix == ".npy": files[path.stem] = path
+    return files
+
+
+def _read_hours(path: Path):
+    # (hours, snrs, counts, days_count, samples) of one band file, counts is None for raw spots
+    if path.suffix == ".npy": return _columnar_hours(np.load(path, mmap_mode="r"))
+
+    data = json.load(open(path))
+    if isinstance(data, dict): return _summary_hours(data)
+
+    date = datetime.strptime(data[0]["time"], "%Y-%m-%d %H:%M:%S")
+    (_, days_count) = calendar.monthrange(date.year, date.month)
+
+    times = np.array([entry["time"] for entry in data], dtype="datetime64[s]")  # Parsed once, not once per hour
+    hours = (times.astype(np.int64) // 3600) % 24
+    return hours, [entry["snr"] for entry in data], None, days_count, len(data)
+
+
+def _columnar_hours(spots: np.ndarray):
+    date = datetime.fromtimestamp(int(spots["time"][0]), timezone.utc)
+    (_, days_count) = calendar.monthrange(date.year, date.month)
+
+    hours = (spots["time"] // 3600) % 24
+    return hours, spots["snr"], None, days_count, len(spots)
+
+
+def _summary_hours(summary: dict):
+    # Server side aggregated band file: per UTC hour a sorted list of [snr, count] pairs, used as weights
+    hours = np.repeat(np.arange(len(HOURS)), [len(hist) for hist in summary["hours"]])
+    pairs = np.array([pair for hist in summary["hours"] for pair in hist], dtype=np.int64).reshape(-1, 2)
+    return hours, pairs[:, 0], pairs[:, 1], summary["days"], summary["samples"]
+
+
+def get_per_hour_distros(path: Path):
+    return _hour_distros(*_read_hours(path))
+
+
+def get_group_norms(paths: list[Path]):
+    # Hourly normal snr distro of every band file at once: a beacon x hour x (snr, up, lw) array and the
+    # sample size per beacon. All files go through one histogram, so the cost grows with spots, not files
+    groups, snrs, counts, samples = [], [], [], []
+    for i, path in enumerate(paths):
+        hours, snr, weight, _, n = _read_hours(path)
+        groups.append(i * len(HOURS) + np.asarray(hours, dtype=np.int64))
+        snrs.append(np.asarray(snr, dtype=np.int64))
+        counts.append(np.ones(len(snrs[-1]), dtype=np.int64) if weight is None else np.asarray(weight, dtype=np.int64))
+        samples.append(n)
+    if not paths: return np.empty((0, len(HOURS), 3)), np.empty(0, dtype=np.int64)
+
+    _, _, _, sizes, (_, p10, p50, p90) = _histograms(
+        np.concatenate(groups), np.concatenate(snrs), np.concatenate(counts), len(paths) * len(HOURS))
+    norms = np.stack([p50, np.abs(p50 - p90) / 1.28, np.abs(p50 - p10) / 1.28], axis=-1)
+    norms[sizes == 0] = np.nan
+    return norms.reshape(len(paths), len(HOURS), 3), np.array(samples, dtype=np.int64)
+
+
+def _norm_array(norm):
+    # (snr, up, lw) columns of a list of hourly normal dicts, arrays pass through
+    if isinstance(norm, np.ndarray): return norm.reshape(-1, 3)
+    return np.array([[n["snr"], n["up"], n["lw"]] for n in norm], dtype=np.float64).reshape(-1, 3)
 
 
 def get_difference_nomral(base: list, comparison: list):
@@ -91,6 +228,7 @@ def plot_errors_bars(dnorm: list, distro: list, path: Path):
 
     # print(", ".join(map(str, dsnr)))
 
+    plt = _pyplot()
     fig, ax = plt.subplots(constrained_layout=True)  # figsize=(12, 4)
 
     bar_width = 0.6 / 3
@@ -131,28 +269,32 @@ def plot_errors_bars(dnorm: list, distro: list, path: Path):
     )
 
     path = path / "error_bars.pdf"
-    CAPTIONS[str(path)] = latex_caption
+    set_caption(path, latex_caption)
+
+    _save(fig, path)
 
-    fig.savefig(path)
-    plt.close(fig)
 
+def plot_req_snr(req_snr: list, band: str, sub_path: str, path: Path, draw: bool = True):
+    from scipy.stats import norm
 
-def plot_req_snr(req_snr: list, band: str, table_path: Path, path: Path):
     samples = np.array(req_snr)
     samples = samples[~np.isnan(samples)]
 
     mu, o = norm.fit(samples)
     if o == 0: return
 
-    file_path = table_path / "TEMP.json"
-    data = json.load(open(file_path)) if file_path.exists() else {}
-    data.setdefault("REQ SNR", {})[band] = {"mu": mu, "o": o, "n": len(samples)}
-    json.dump(data, open(file_path, "w"), indent=2)
+    put_result(sub_path, "REQ SNR", band, value={"mu": mu, "o": o, "n": len(samples)})
+    if draw: _submit(path / "low_req_snr.pdf", draw_req_snr, mu, o, len(samples), path)
+
+
+def draw_req_snr(mu: float, o: float, n: int, path: Path):
+    from scipy.stats import norm
 
     o_off = 4
     x = np.linspace(mu - o_off * o, mu + o_off * o, 300)
     pdf = norm.pdf(x, mu, o)
 
+    plt = _pyplot()
     fig, ax = plt.subplots(constrained_layout=True)  # figsize=(10, 10),
 
     ax.plot(x, pdf, lw=1, color="#0052CC")
@@ -173,96 +315,100 @@ def plot_req_snr(req_snr: list, band: str, table_path: Path, path: Path):
 
     latex_caption = (
         rf"\\REQ SNR estimation"
-        rf"\\Sample size: $n = {len(data)}$"
+        rf"\\Sample size: $n = {n}$"
         rf"\\Fitted Normal: $\mu = {mu:.2f}$ dB,\quad $\sigma = {o:.2f}$ dB"
     )
 
     path = path / f"low_req_snr.pdf"
-    CAPTIONS[str(path)] = latex_caption
+    set_caption(path, latex_caption)
 
-    fig.savefig(path)
-    plt.close(fig)
+    _save(fig, path)
 
 
 def plot_hour_normal_distros(wspr_norm: list, voacap_norm: list, wspr_distro: list, path: Path):
+    # One figure job per hour, so a pool draws the hours of a band side by side
     for H in HOURS:
-        hour_distro = wspr_distro[H]
-        if not hour_distro["snr"]: continue
-
-        # Parameters for two split normal distributions
-        wspr = wspr_norm[H]
-        mu1 = wspr["snr"]
-        o_l1 = wspr["lw"]
-        o_u1 = wspr["up"]
-
-        voacap = voacap_norm[H]
-        mu2 = voacap["snr"]
-        o_l2 = voacap["lw"]
-        o_u2 = voacap["up"]
-
-        if o_l1 == 0 or o_u1 == 0 or o_l2 == 0 or o_u2 == 0: continue
-
-        A1, A2 = np.sqrt(2 / np.pi) / (o_l1 + o_u1), np.sqrt(2 / np.pi) / (o_l2 + o_u2)
-
-        # Generate x values over a range covering both distributions
-        o_off = 4
-        x = np.linspace(
-            min(hour_distro["snr"][0], mu1 - o_off * o_u1, mu2 - o_off * o_u2),
-            max(hour_distro["snr"][-1], mu1 + o_off * o_u1, mu2 + o_off * o_u2),
-            300
-        )
-
-        # Compute piecewise PDFs
-        pdf1 = np.where(
-            x < mu1,
-            A1 * np.exp(-(((x - mu1) ** 2) / (2 * o_l1 ** 2))),
-            A1 * np.exp(-(((x - mu1) ** 2) / (2 * o_u1 ** 2)))
-        )
-        pdf2 = np.where(
-            x < mu2,
-            A2 * np.exp(-(((x - mu2) ** 2) / (2 * o_l2 ** 2))),
-            A2 * np.exp(-(((x - mu2) ** 2) / (2 * o_u2 ** 2)))
-        )
-
-        # Plot both on the same axes
-        fig, ax = plt.subplots(constrained_layout=True)  # figsize=(10, 10),
+        if not wspr_distro[H]["snr"]: continue
+        _submit(path / f"normal_h{H:02d}.pdf", plot_hour_normal_distro, H, wspr_norm[H], voacap_norm[H], wspr_distro[H],
+                path)
 
-        label1, = ax.plot(hour_distro["snr"], hour_distro["p"], lw=1, color="#0052CC", label="WSPR Observed")
-        ax.fill_between(hour_distro["snr"], 0, hour_distro["p"], alpha=0.2)
-        label2, = ax.plot(x, pdf1, lw=1, color="#CC0000", label="WSPR Fitted")
-        ax.fill_between(x, 0, pdf1, alpha=0.2)
-        label3, = ax.plot(x, pdf2, lw=1, color="#2CA02C", label="VOACAP Prediction")
-        ax.fill_between(x, 0, pdf2, alpha=0.2)
 
-        ax.set_title(f"SNR Distribution at Hour {H:02d} (UTC)")
-        ax.set_ylabel("Probability Density")
-        ax.set_xlabel("SNR [dB]")
+def plot_hour_normal_distro(H: int, wspr: dict, voacap: dict, hour_distro: dict, path: Path):
+    plt = _pyplot()
 
-        ax.margins(x=0, y=0)
-        ymin, ymax = ax.get_ylim()
-        padding = 0.05 * (ymax - ymin)
-        ax.set_ylim(ymin, ymax + padding)
+    # Parameters for two split normal distributions
+    mu1 = wspr["snr"]
+    o_l1 = wspr["lw"]
+    o_u1 = wspr["up"]
 
-        ax.legend(handles=[label1, label2, label3], framealpha=0.5)
-        ax.minorticks_on()
-        ax.grid(True, which='major', alpha=0.5)
-        ax.grid(True, which='minor', alpha=0.3)
+    mu2 = voacap["snr"]
+    o_l2 = voacap["lw"]
+    o_u2 = voacap["up"]
 
-        latex_caption = (
-            rf"\\WSPR sample size: $n = {hour_distro["size"]}$"
-            rf"\\WSPR: $\mu = {int(mu1) if not np.isnan(mu1) else "nan"}$,\quad $\sigma_{{\mathrm{{UP}}}} = {o_u1:.2f}$,\quad $\sigma_{{\mathrm{{LW}}}} = {o_l1:.2f}$"
-            rf"\\VOACAP: $\mu = {int(mu2) if not np.isnan(mu2) else "nan"}$,\quad $\sigma_{{\mathrm{{UP}}}} = {o_u2:.2f}$,\quad $\sigma_{{\mathrm{{LW}}}} = {o_l2:.2f}$"
-        )
+    if o_l1 == 0 or o_u1 == 0 or o_l2 == 0 or o_u2 == 0: return
 
-        file_path = path / f"normal_h{H:02d}.pdf"
-        CAPTIONS[str(file_path)] = latex_caption
+    A1, A2 = np.sqrt(2 / np.pi) / (o_l1 + o_u1), np.sqrt(2 / np.pi) / (o_l2 + o_u2)
 
-        fig.savefig(file_path)
-        plt.close(fig)
+    # Generate x values over a range covering both distributions
+    o_off = 4
+    x = np.linspace(
+        min(hour_distro["snr"][0], mu1 - o_off * o_u1, mu2 - o_off * o_u2),
+        max(hour_distro["snr"][-1], mu1 + o_off * o_u1, mu2 + o_off * o_u2),
+        300
+    )
+
+    # Compute piecewise PDFs
+    pdf1 = np.where(
+        x < mu1,
+        A1 * np.exp(-(((x - mu1) ** 2) / (2 * o_l1 ** 2))),
+        A1 * np.exp(-(((x - mu1) ** 2) / (2 * o_u1 ** 2)))
+    )
+    pdf2 = np.where(
+        x < mu2,
+        A2 * np.exp(-(((x - mu2) ** 2) / (2 * o_l2 ** 2))),
+        A2 * np.exp(-(((x - mu2) ** 2) / (2 * o_u2 ** 2)))
+    )
+
+    # Plot both on the same axes
+    fig, ax = plt.subplots(constrained_layout=True)  # figsize=(10, 10),
+
+    label1, = ax.plot(hour_distro["snr"], hour_distro["p"], lw=1, color="#0052CC", label="WSPR Observed")
+    ax.fill_between(hour_distro["snr"], 0, hour_distro["p"], alpha=0.2)
+    label2, = ax.plot(x, pdf1, lw=1, color="#CC0000", label="WSPR Fitted")
+    ax.fill_between(x, 0, pdf1, alpha=0.2)
+    label3, = ax.plot(x, pdf2, lw=1, color="#2CA02C", label="VOACAP Prediction")
+    ax.fill_between(x, 0, pdf2, alpha=0.2)
+
+    ax.set_title(f"SNR Distribution at Hour {H:02d} (UTC)")
+    ax.set_ylabel("Probability Density")
+    ax.set_xlabel("SNR [dB]")
+
+    ax.margins(x=0, y=0)
+    ymin, ymax = ax.get_ylim()
+    padding = 0.05 * (ymax - ymin)
+    ax.set_ylim(ymin, ymax + padding)
+
+    ax.legend(handles=[label1, label2, label3], framealpha=0.5)
+    ax.minorticks_on()
+    ax.grid(True, which='major', alpha=0.5)
+    ax.grid(True, which='minor', alpha=0.3)
+
+    latex_caption = (
+        rf"\\WSPR sample size: $n = {hour_distro["size"]}$"
+        rf"\\WSPR: $\mu = {int(mu1) if not np.isnan(mu1) else "nan"}$,\quad $\sigma_{{\mathrm{{UP}}}} = {o_u1:.2f}$,\quad $\sigma_{{\mathrm{{LW}}}} = {o_l1:.2f}$"
+        rf"\\VOACAP: $\mu = {int(mu2) if not np.isnan(mu2) else "nan"}$,\quad $\sigma_{{\mathrm{{UP}}}} = {o_u2:.2f}$,\quad $\sigma_{{\mathrm{{LW}}}} = {o_l2:.2f}$"
+    )
+
+    file_path = path / f"normal_h{H:02d}.pdf"
+    set_caption(file_path, latex_caption)
+
+    _save(fig, file_path)
 
 
 def calculate_point_rel(wspr_norm: list[dict[str, float]], voacap_rel: list[float], count_rel: list[float], band: str,
-                        path: Path):
+                        sub_path: str):
+    from scipy.stats import norm
+
     REL = {}
     interp_rel: list[float] = []
     for n in wspr_norm:
@@ -278,10 +424,7 @@ def calculate_point_rel(wspr_norm: list[dict[str, float]], voacap_rel: list[floa
     REL["DIFF"] = {"avg": np.nanmean(diff_rel), "rel": diff_rel}
     REL["TRUE DIFF"] = {"avg": np.nanmean(true_diff_rel), "rel": true_diff_rel}
 
-    file_path = path / "TEMP.json"
-    data = json.load(open(file_path)) if file_path.exists() else {}
-    data.setdefault("REL", {})[band] = REL
-    json.dump(data, open(file_path, "w"), indent=2)
+    put_result(sub_path, "REL", band, value=REL)
 
     print("Reliabilty")
     print(
@@ -318,88 +461,34 @@ def calculate_point_rel(wspr_norm: list[dict[str, float]], voacap_rel: list[floa
     print()
 
 
-def calculate_point_score(wspr_norm: list[dict[str, float]], voacap_norm: list[dict[str, float]], band: str,
-                          category: str, path: Path):
-    cohen = []
-    lvr_up = []
-    lvr_lw = []
-    for w, v in zip(wspr_norm, voacap_norm):
-        ws, wu, wl = w["snr"], w["up"], w["lw"]
-        vs, vu, vl = v["snr"], v["up"], v["lw"]
+def calculate_point_score(wspr_norm: list[dict[str, float]] | np.ndarray, voacap_norm: list[dict[str, float]] | np.ndarray,
+                          band: str, category: str, sub_path: str):
+    ws, wu, wl = _norm_array(wspr_norm).T
+    vs, vu, vl = _norm_array(voacap_norm).T
 
+    with np.errstate(divide="ignore", invalid="ignore"):
         den = np.sqrt((wu ** 2 + wl ** 2 + vu ** 2 + vl ** 2) / 4)
-        cohen.append(np.nan if den == 0 else np.divide(vs - ws, den))
+        cohen = np.where(den == 0, np.nan, (vs - ws) / den)
 
-        lvr_up.append(np.nan if wu == 0 or vu == 0 else np.log(vu / wu))
-        lvr_lw.append(np.nan if wl == 0 or vl == 0 else np.log(vl / wl))
+        lvr_up = np.where((wu == 0) | (vu == 0), np.nan, np.log(vu / wu))
+        lvr_lw = np.where((wl == 0) | (vl == 0), np.nan, np.log(vl / wl))
 
-    vs_u, vs_o = 2.0, 0.4
-    s_u, s_o = 4.00, 0.8
-    m_u, m_o = 6.00, 1.2
-    l_u, l_o = 8.00, 1.6
-    vl_u, vl_o = 10.0, 2.0
-    h_u, h_o = 14.0, 2.2
+    cohen_bounds = [-np.inf, 2.0, 4.0, 6.0, 8.0, 10.0, 14.0, np.inf]
+    lvr_bounds = [-np.inf, 0.4, 0.8, 1.2, 1.6, 2.0, 2.2, np.inf]
+    labels = ["Very small:", "Small:\t", "Medium:\t", "Large:\t", "Very Large:", "Huge:\t", "Crazy:\t"]
     print("\t\t\t  Cohen\tLVR(UP)\t LVR(LW)")
-    print(
-        "Very small:",
-        sum(abs(v) <= vs_u for v in cohen),
-        sum(abs(v) <= vs_o for v in lvr_up),
-        sum(abs(v) <= vs_o for v in lvr_lw),
-        sep="\t\t")
-    print(
-        "Small:\t",
-        sum(vs_u < abs(v) <= s_u for v in cohen),
-        sum(vs_o < abs(v) <= s_o for v in lvr_up),
-        sum(vs_o < abs(v) <= s_o for v in lvr_lw),
-        sep="\t\t")
-    print(
-        "Medium:\t",
-        sum(s_u < abs(v) <= m_u for v in cohen),
-        sum(s_o < abs(v) <= m_o for v in lvr_up),
-        sum(s_o < abs(v) <= m_o for v in lvr_lw),
-        sep="\t\t")
-    print(
-        "Large:\t",
-        sum(m_u < abs(v) <= l_u for v in cohen),
-        sum(m_o < abs(v) <= l_o for v in lvr_up),
-        sum(m_o < abs(v) <= l_o for v in lvr_lw),
-        sep="\t\t")
-    print(
-        "Very Large:",
-        sum(l_u < abs(v) <= vl_u for v in cohen),
-        sum(l_o < abs(v) <= vl_o for v in lvr_up),
-        sum(l_o < abs(v) <= vl_o for v in lvr_lw),
-        sep="\t\t")
-    print(
-        "Huge:\t",
-        sum(vl_u < abs(v) <= h_u for v in cohen),
-        sum(vl_o < abs(v) <= h_o for v in lvr_up),
-        sum(vl_o < abs(v) <= h_o for v in lvr_lw),
-        sep="\t\t")
-    print(
-        "Crazy:\t",
-        sum(h_u < abs(v) for v in cohen),
-        sum(h_o < abs(v) for v in lvr_up),
-        sum(h_o < abs(v) for v in lvr_lw),
-        sep="\t\t")
-
-    file_path = path / "TEMP.json"
-    if file_path.exists():
-        data = json.load(open(file_path))
-        data.setdefault("SCORE", {}).setdefault(category, {}).setdefault(band, {})
-
-        data["SCORE"][category][band]["cohen's d"] = np.sort(cohen).tolist()
-        data["SCORE"][category][band]["lvr_up"] = np.sort(lvr_up).tolist()
-        data["SCORE"][category][band]["lvr_lw"] = np.sort(lvr_lw).tolist()
-    else:
-        data = {"SCORE": {category: {band:
-            {
-                "cohen's d": np.sort(cohen).tolist(),
-                "lvr_up": np.sort(lvr_up).tolist(),
-                "lvr_lw": np.sort(lvr_lw).tolist()
-            }
-        }}}
-    json.dump(data, open(file_path, "w"), indent=2)
+    for i, label in enumerate(labels):
+        print(
+            label,
+            *(np.sum((bounds[i] < np.abs(v)) & (np.abs(v) <= bounds[i + 1]))
+              for v, bounds in [(cohen, cohen_bounds), (lvr_up, lvr_bounds), (lvr_lw, lvr_bounds)]),
+            sep="\t\t")
+
+    put_result(sub_path, "SCORE", category, band, value={
+        "cohen's d": np.sort(cohen).tolist(),
+        "lvr_up": np.sort(lvr_up).tolist(),
+        "lvr_lw": np.sort(lvr_lw).tolist()
+    })
     # """
     print()
     print(
@@ -464,52 +553,48 @@ def calculate_point_score(wspr_norm: list[dict[str, float]], voacap_norm: list[d
 
 
 def make_point_plots(path: Path, band: str, snr: list[float], snr_up: list[float], snr_lw: list[float],
-                     voacap_rel: list[float]):
+                     voacap_rel: list[float], draw: bool = True):
     point_path = FIGURE_POINT_PATH / path.relative_to(path.parent.parent) / band
-    temp_path = DATA_TEMP_PATH / path.relative_to(path.parent.parent)
-    point_path.mkdir(parents=True, exist_ok=True)
-    temp_path.mkdir(parents=True, exist_ok=True)
-
-    voacap_norm = [{
-        "snr": s - SNR_OFFSET,
-        "up": np.nan if up == 0 else abs(up / 1.28),
-        "lw": np.nan if lw == 0 else abs(lw / 1.28)
-    } for s, up, lw in zip(snr, snr_up, snr_lw)]
-
-    wspr_norm, wspr_distro, wspr_req_snr, count_rel, _ = get_per_hour_distros(path / f"{band}.json")
-
-    file_path = temp_path / "TEMP.json"
-    data = json.load(open(file_path)) if file_path.exists() else {}
-    data.setdefault("WSPR_NORM", {})[band] = wspr_norm
-    json.dump(data, open(file_path, "w"), indent=2)
-
-    calculate_point_score(wspr_norm, voacap_norm, band, "SINGLE", temp_path)
-    calculate_point_rel(wspr_norm, voacap_rel, count_rel, band, temp_path)
-    plot_errors_bars(get_difference_nomral(voacap_norm, wspr_norm), wspr_distro, point_path)
-    plot_req_snr(wspr_req_snr, band, temp_path, point_path)
-    plot_hour_normal_distros(wspr_norm, voacap_norm, wspr_distro, point_path)
+    sub_path = str(path.relative_to(path.parent.parent))
+    if draw: point_path.mkdir(parents=True, exist_ok=True)
+
+    with span("stats", circuit=sub_path, band=band):
+        voacap_norm = [{
+            "snr": s - SNR_OFFSET,
+            "up": np.nan if up == 0 else abs(up / 1.28),
+            "lw": np.nan if lw == 0 else abs(lw / 1.28)
+        } for s, up, lw in zip(snr, snr_up, snr_lw)]
+
+        wspr_norm, wspr_distro, wspr_req_snr, count_rel, _ = get_per_hour_distros(spot_files(path.glob(f"{band}.*"))[band])
+
+        put_result(sub_path, "WSPR_NORM", band, value=wspr_norm)
 
+        calculate_point_score(wspr_norm, voacap_norm, band, "SINGLE", sub_path)
+        calculate_point_rel(wspr_norm, voacap_rel, count_rel, band, sub_path)
+        plot_req_snr(wspr_req_snr, band, sub_path, point_path, draw)
+    if not draw: return
 
-def plot_group_errors_bars(dicts: list, band, center, path: Path):
-    rx, dist, dnorm, size = zip(*[(d["rx"], d["dist"], d["dnorm"], d["samples"]) for d in dicts])
-    avg_dsnr, avg_dup, avg_dlw = [], [], []
+    # Drawing is timed per figure where it happens, see tools.render
+    _submit(point_path / "error_bars.pdf", plot_errors_bars, get_difference_nomral(voacap_norm, wspr_norm), wspr_distro,
+            point_path)
+    plot_hour_normal_distros(wspr_norm, voacap_norm, wspr_distro, point_path)
 
-    for dn in dnorm:
-        snr, up, lw = zip(*[(d["snr"], d["up"], d["lw"]) for d in dn])
 
-        avg_dsnr.append(np.nanmean(np.abs(np.array(snr))))
-        avg_dup.append(np.nanmean(np.abs(np.array(up))))
-        avg_dlw.append(np.nanmean(np.abs(np.array(lw))))
+def plot_group_errors_bars(rx: list[str], dist: list[float], dnorm: np.ndarray, size: list[int], band, center,
+                           path: Path):
+    # dnorm: beacon x hour x (snr, up, lw) deviations from the center receiver
+    avg_dsnr, avg_dup, avg_dlw = np.nanmean(np.abs(dnorm), axis=1).T
 
+    plt = _pyplot()
     fig, ax = plt.subplots(constrained_layout=True)
 
-    count = 0
+    plotted = 0
     for i, (label, x, snr, up, lw) in enumerate(zip(rx, dist, avg_dsnr, avg_dup, avg_dlw)):
         if snr == np.nan or up == np.nan or lw == np.nan: continue
         ax.errorbar(x, snr, yerr=[[lw], [up]], fmt='o', capsize=4, label=label.replace("∕", "/"))
-        count += 1
+        plotted += 1
 
-    if count == 0:
+    if plotted == 0:
         plt.close(fig)
         return
 
@@ -535,23 +620,18 @@ def plot_group_errors_bars(dicts: list, band, center, path: Path):
     )
 
     file_path = path / f"error_{band}.pdf"
-    CAPTIONS[str(file_path)] = latex_caption
+    set_caption(file_path, latex_caption)
 
-    fig.savefig(file_path)
-    plt.close(fig)
+    _save(fig, file_path)
 
 
-def make_group_plots(path: Path, band: str):
+def make_group_plots(path: Path, band: str, draw: bool = True):
     group_path = FIGURE_GROUP_PATH / path.relative_to(path.parent.parent)
-    temp_path = DATA_TEMP_PATH / path.relative_to(path.parent.parent)
-    group_path.mkdir(parents=True, exist_ok=True)
-    temp_path.mkdir(parents=True, exist_ok=True)
+    sub_path = str(path.relative_to(path.parent.parent))
+    if draw: group_path.mkdir(parents=True, exist_ok=True)
     name = path.parent.name
 
-    temp_file_path = temp_path / "TEMP.json"
-    if not temp_file_path.exists(): return
-    data = json.load(open(temp_file_path))
-
+    data = get_results(sub_path)
     if "WSPR_NORM" not in data or band not in data["WSPR_NORM"]: return
     if "POWER" not in data or name not in data["POWER"]: return
     if "DIST" not in data: return
@@ -560,43 +640,25 @@ def make_group_plots(path: Path, band: str):
     wspr_norm = data["WSPR_NORM"][band]
     beacon_dist = data["DIST"]
 
-    power = data["POWER"][name]
-    for entry in wspr_norm:
-        entry["snr"] -= power
-
-    # Get hourly normal snr distro and total sample size per beacon
-    group = {
-        file_path.stem.split("_")[1]: {"norm": norm, "samples": samples}
-        for file_path in sorted(path.glob(f"{band}/*.json"))
-        for norm, _, _, _, samples in [get_per_hour_distros(file_path)]
-    }
-
-    # Filter out when one of the beacons lacks data in a band
-    center = wspr_norm * len(group)
-    neighbors = []
-    dicts = []
-    for rx in group:
-        group_norm = group[rx]["norm"]
+    with span("stats", circuit=sub_path, band=band, group=True):
+        # Hourly normal snr distro and total sample size per beacon, beacon x hour x (snr, up, lw)
+        files = spot_files(path.glob(f"{band}/*"))
+        group = [stem.split("_")[1] for stem in files]
+        norms, samples = get_group_norms(list(files.values()))
 
         TX = name.split("_")[0]
-        power = data["POWER"][f"{TX}_{rx}"]
-        for entry in group_norm:
-            entry["snr"] -= power
-        neighbors.extend(group_norm)
-
-        dnorm = get_difference_nomral(group_norm, wspr_norm)
-
-        if all(all(np.isnan(v) for v in d.values()) for d in dnorm):
-            continue
+        center = _norm_array(wspr_norm)
+        center[:, 0] -= data["POWER"][name]
+        norms[:, :, 0] -= np.array([data["POWER"][f"{TX}_{rx}"] for rx in group], dtype=np.float64).reshape(-1, 1)
+        dnorm = norms - center
 
-        dicts.append({
-            "rx": rx,
-            "dist": beacon_dist[f"{RX}_{rx}"],
-            "dnorm": dnorm,
-            "samples": group[rx]["samples"]
-        })
+        calculate_point_score(np.tile(center, (len(group), 1)), norms, band, "GROUP", sub_path)
 
-    calculate_point_score(center, neighbors, band, "GROUP", temp_path)
+        # Filter out when one of the beacons lacks data in a band
+        keep = np.flatnonzero(~np.isnan(dnorm).all(axis=(1, 2)))
+        rx = [group[i] for i in keep]
+        dist = [beacon_dist[f"{RX}_{r}"] for r in rx]
 
-    if len(dicts) != 0:
-        plot_group_errors_bars(dicts, band, RX, group_path)
+    if draw and len(rx) != 0:
+        _submit(group_path / f"error_{band}.pdf", plot_group_errors_bars, rx, dist, dnorm[keep], samples[keep].tolist(),
+                band, RX, group_path)
@@ -0,0 +1,109 @@
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+RUN_REPORT_PATH: Path = Path("data/run_report.json")
+PROFILE_PATH: Path = Path("data/profile")
+
+SPANS: list[dict] = []
+COUNTERS: dict[str, int] = {}
+PROFILE_SETTINGS: dict[str, bool] = {"memory": False, "cprofile": False}
+
+_peaks: list[int] = []  # Running tracemalloc peak of every open span, innermost last
+
+
+def configure(memory: bool = False, cprofile: bool = False):
+    PROFILE_SETTINGS.update(memory=memory, cprofile=cprofile)
+    if memory and not tracemalloc.is_tracing(): tracemalloc.start()
+
+
+@contextmanager
+def span(stage: str, **labels):
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        # reset_peak is global, so the peak seen so far is handed to the enclosing span first
+        if _peaks: _peaks[-1] = max(_peaks[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        _peaks.append(0)
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = {"stage": stage, "labels": labels, "seconds": time.perf_counter() - start, "pid": os.getpid()}
+        if tracing:
+            record["peak_bytes"] = max(_peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if _peaks: _peaks[-1] = max(_peaks[-1], record["peak_bytes"])
+        SPANS.append(record)
+
+
+@contextmanager
+def profile_stage(stage: str):
+    # One cProfile dump per top level stage, open with python -m pstats or snakeviz
+    with span(f"stage:{stage}"):
+        if not PROFILE_SETTINGS["cprofile"]:
+            yield
+            return
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            PROFILE_PATH.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(PROFILE_PATH / f"{stage}.prof")
+
+
+def count(name: str, n: int = 1):
+    COUNTERS[name] = COUNTERS.get(name, 0) + n
+
+
+def take_profile():
+    # Hands the spans and counters of a worker process back to the parent, see merge_profile
+    profile = {"spans": list(SPANS), "counters": dict(COUNTERS)}
+    SPANS.clear()
+    COUNTERS.clear()
+    return profile
+
+
+def merge_profile(other: dict):
+    SPANS.extend(other["spans"])
+    for name, n in other["counters"].items():
+        count(name, n)
+
+
+def run_report(slowest: int = 20):
+    stages = {}
+    for record in SPANS:
+        stats = stages.setdefault(record["stage"], {"spans": 0, "seconds": 0.0, "max_seconds": 0.0})
+        stats["spans"] += 1
+        stats["seconds"] += record["seconds"]
+        stats["max_seconds"] = max(stats["max_seconds"], record["seconds"])
+        if "peak_bytes" in record: stats["peak_bytes"] = max(stats.get("peak_bytes", 0), record["peak_bytes"])
+
+    return {
+        "stages": stages,
+        "counters": COUNTERS,
+        "slowest": sorted(SPANS, key=lambda record: record["seconds"], reverse=True)[:slowest],
+        "spans": SPANS,
+    }
+
+
+def write_run_report(path: Path = RUN_REPORT_PATH):
+    report = run_report()
+    print(f" {"Stage":<16}{"Spans":>8}{"Seconds":>10}{"Max":>9}{"Peak MiB":>10}")
+    for stage, stats in report["stages"].items():
+        peak = f"{stats["peak_bytes"] / 1024 ** 2:.1f}" if "peak_bytes" in stats else "-"
+        print(f" {stage:<16}{stats["spans"]:>8}{stats["seconds"]:>10.2f}{stats["max_seconds"]:>9.2f}{peak:>10}")
+    for name, n in report["counters"].items():
+        print(f" {name}: {n}")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2, default=str)
+    return report
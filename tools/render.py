@@ -0,0 +1,176 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from tools.profiling import span, count, take_profile, merge_profile
+
+CAPTIONS_PATH: Path = Path("data/captions.json")
+FIGURE_CACHE_PATH: Path = Path("data/cache/figures")
+FIGURE_CACHE_MAX_BYTES: int = 1024 ** 3
+
+# publication: pgf through pdflatex, the fonts of the paper. draft: Agg/PDF with mathtext, no LaTeX run per figure,
+# and a PNG next to every PDF when png_dpi is set
+RENDER_MODES = ("publication", "draft")
+RENDER_SETTINGS: dict = {"mode": "publication", "png_dpi": None, "cache": True}
+
+# Figure path -> LaTeX caption. Workers only hand back what they set, the parent is the only writer of the file
+CAPTIONS: dict[str, str] = {}
+_written: dict[str, str] = {}
+
+# Figure jobs of the open render_queue, None draws right away. Workers inherit the list through fork and
+# only get the index of a job, so the arrays it holds are never pickled
+_queue: list | None = None
+
+
+def configure_render(mode: str = "publication", png_dpi: int | None = None, cache: bool = True):
+    if mode not in RENDER_MODES: raise ValueError(f"Unknown render mode {mode!r}, expected one of {RENDER_MODES}")
+    RENDER_SETTINGS.update(mode=mode, png_dpi=png_dpi if mode == "draft" else None, cache=cache)
+
+
+def set_caption(path: Path, caption: str):
+    CAPTIONS[str(path)] = caption
+    _written[str(path)] = caption
+
+
+def take_captions():
+    captions = dict(_written)
+    _written.clear()
+    return captions
+
+
+def load_captions():
+    # Figures that are not redrawn keep the captions of the run that drew them
+    if CAPTIONS_PATH.exists(): CAPTIONS.update(json.load(open(CAPTIONS_PATH)))
+
+
+def save_captions():
+    CAPTIONS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = CAPTIONS_PATH.with_suffix(f".{os.getpid()}.tmp")
+    with open(temp_path, "w") as file:
+        json.dump(CAPTIONS, file, indent=2)
+    os.replace(temp_path, CAPTIONS_PATH)
+
+
+def _fingerprint(value):
+    # Arrays are hashed by content, str() of a large array elides most of it
+    if isinstance(value, np.ndarray):
+        return [str(value.dtype), value.shape, hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()]
+    if isinstance(value, np.generic): return value.item()
+    return str(value)
+
+
+def figure_key(function, args: tuple, version=None):
+    # version: whatever else decides how the figure looks, e.g. the plotting code and its rcParams
+    settings = {"mode": RENDER_SETTINGS["mode"], "png_dpi": RENDER_SETTINGS["png_dpi"]}
+    inputs = [function.__module__, function.__qualname__, args, version, settings]
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=_fingerprint).encode()).hexdigest()
+
+
+def _figure_files(output: Path):
+    # The PDF and, in draft mode with png_dpi set, the PNG next to it
+    return [output, output.with_suffix(".png")] if RENDER_SETTINGS["png_dpi"] else [output]
+
+
+def figure_cache_get(key: str, output: Path):
+    entry = FIGURE_CACHE_PATH / f"{key}.json"
+    try:
+        caption = json.load(open(entry))["caption"]
+        for path in _figure_files(output):
+            shutil.copyfile(FIGURE_CACHE_PATH / f"{key}{path.suffix}", path)
+        os.utime(entry)  # Mark as recently used
+    except FileNotFoundError:
+        return False
+    if caption is not None: set_caption(output, caption)
+    count("figures_cached")
+    return True
+
+
+def figure_cache_put(key: str, output: Path):
+    FIGURE_CACHE_PATH.mkdir(parents=True, exist_ok=True)
+    for path in _figure_files(output):
+        temp_path = FIGURE_CACHE_PATH / f"{key}.{os.getpid()}.tmp"
+        shutil.copyfile(path, temp_path)
+        os.replace(temp_path, FIGURE_CACHE_PATH / f"{key}{path.suffix}")
+
+    # The caption entry goes last, an entry without it is never read
+    temp_path = FIGURE_CACHE_PATH / f"{key}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as file:
+        json.dump({"caption": CAPTIONS.get(str(output))}, file)
+    os.replace(temp_path, FIGURE_CACHE_PATH / f"{key}.json")
+
+
+def figure_cache_evict(max_bytes: int = FIGURE_CACHE_MAX_BYTES):
+    # Least recently used figures go first, all files of an entry together
+    entries = {}
+    for path in FIGURE_CACHE_PATH.glob("*"):
+        if path.suffix == ".tmp": continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entry = entries.setdefault(path.name.split(".")[0], {"mtime": 0.0, "size": 0, "paths": []})
+        if path.suffix == ".json": entry["mtime"] = stat.st_mtime
+        entry["size"] += stat.st_size
+        entry["paths"].append(path)
+
+    total = sum(entry["size"] for entry in entries.values())
+    for entry in sorted(entries.values(), key=lambda entry: entry["mtime"]):
+        if total <= max_bytes: break
+        for path in entry["paths"]:
+            path.unlink(missing_ok=True)
+        total -= entry["size"]
+
+
+def _draw(output: Path, key: str | None, function, args):
+    for path in _figure_files(output):
+        path.unlink(missing_ok=True)  # A job that ends up drawing nothing must not leave an old figure behind
+    with span("figure", function=function.__name__, path=str(output)):
+        function(*args)
+    if key is not None and output.exists(): figure_cache_put(key, output)
+
+
+def submit(output: Path, function, *args, version=None):
+    # output: the PDF the job writes. Figures whose inputs did not change are copied from the cache with their caption
+    key = figure_key(function, args, version) if RENDER_SETTINGS["cache"] else None
+    if key is not None and figure_cache_get(key, output): return
+    if _queue is None: return _draw(output, key, function, args)
+    _queue.append((output, key, function, args))
+
+
+def _init_worker():
+    # Drop the spans, counters and captions of the parent that came along with the fork
+    take_profile()
+    take_captions()
+
+
+def _render_worker(i: int):
+    _draw(*_queue[i])
+    return take_captions(), take_profile()
+
+
+@contextmanager
+def render_queue(workers: int = os.cpu_count()):
+    # Figures submitted inside the block are drawn by a pool of forked workers when it closes
+    global _queue
+    if workers <= 1 or _queue is not None or "fork" not in multiprocessing.get_all_start_methods():
+        yield
+        return
+
+    _queue = []
+    try:
+        yield
+        if _queue:
+            with span("render", figures=len(_queue), workers=min(workers, len(_queue))):
+                context = multiprocessing.get_context("fork")
+                with context.Pool(min(workers, len(_queue)), initializer=_init_worker) as pool:
+                    for captions, profile in pool.imap(_render_worker, range(len(_queue))):
+                        CAPTIONS.update(captions)
+                        merge_profile(profile)
+    finally:
+        _queue = None
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+
+RESULTS_PATH: Path = Path("data/data/results.sqlite")
+
+# Results are staged per circuit-month (sub path) and written in one transaction by flush_results
+_pending: dict[str, dict[tuple, str]] = {}
+
+
+def _connect():
+    RESULTS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(RESULTS_PATH, timeout=60)
+    connection.execute("PRAGMA journal_mode=WAL")  # Readers never block the writer of another circuit-month
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS results ("
+        "sub_path TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (sub_path, key))")
+    return connection
+
+
+def put_result(sub_path: str, *keys: str, value):
+    _pending.setdefault(str(sub_path), {})[keys] = json.dumps(value)
+
+
+def _matches(keys: tuple, prefixes):
+    # Keys that start with one of the prefixes, every key without prefixes
+    return not prefixes or any(keys[:len(prefix)] == tuple(prefix) for prefix in prefixes)
+
+
+def _delete(connection, sub_path: str, prefixes):
+    if not prefixes:
+        connection.execute("DELETE FROM results WHERE sub_path = ?", (sub_path,))
+        return
+    keys = [
+        key for (key,) in connection.execute("SELECT key FROM results WHERE sub_path = ?", (sub_path,))
+        if _matches(tuple(json.loads(key)), prefixes)
+    ]
+    connection.executemany("DELETE FROM results WHERE sub_path = ? AND key = ?", [(sub_path, key) for key in keys])
+
+
+def flush_results(sub_path: str | None = None, replace: list[tuple] = ()):
+    # replace: key prefixes the caller rebuilt for sub_path, their old rows go in the same transaction
+    sub_paths = [str(sub_path)] if sub_path is not None else list(_pending)
+    rows = [
+        (path, json.dumps(list(keys)), value)
+        for path in sub_paths
+        for keys, value in _pending.pop(path, {}).items()
+    ]
+    if not rows and not (replace and RESULTS_PATH.exists()): return
+
+    connection = _connect()
+    try:
+        with connection:
+            if replace: _delete(connection, str(sub_path), replace)
+            connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", rows)
+    finally:
+        connection.close()
+
+
+def delete_results(sub_path: str, *prefixes: tuple):
+    pending = _pending.get(str(sub_path), {})
+    for keys in [keys for keys in pending if _matches(keys, prefixes)]:
+        del pending[keys]
+    if not RESULTS_PATH.exists(): return
+    connection = _connect()
+    try:
+        with connection:
+            _delete(connection, str(sub_path), prefixes)
+    finally:
+        connection.close()
+
+
+def _nest(rows):
+    data = {}
+    for keys, value in rows:
+        node = data
+        for key in keys[:-1]:
+            node = node.setdefault(key, {})
+        node[keys[-1]] = value
+    return data
+
+
+def get_results(sub_path: str):
+    sub_path = str(sub_path)
+    rows = {}
+    if RESULTS_PATH.exists():
+        connection = _connect()
+        try:
+            for key, value in connection.execute("SELECT key, value FROM results WHERE sub_path = ?", (sub_path,)):
+                rows[tuple(json.loads(key))] = value
+        finally:
+            connection.close()
+    rows.update(_pending.get(sub_path, {}))
+    return _nest((keys, json.loads(value)) for keys, value in sorted(rows.items(), key=lambda item: item[0]))
+
+
+def result_sub_paths():
+    if not RESULTS_PATH.exists(): return []
+    connection = _connect()
+    try:
+        return [row[0] for row in connection.execute("SELECT DISTINCT sub_path FROM results ORDER BY sub_path")]
+    finally:
+        connection.close()
+
+
+def results_digest():
+    if not RESULTS_PATH.exists(): return None
+    digest = hashlib.sha256()
+    connection = _connect()
+    try:
+        for row in connection.execute("SELECT sub_path, key, value FROM results ORDER BY sub_path, key"):
+            digest.update("\0".join(row).encode())
+            digest.update(b"\n")
+    finally:
+        connection.close()
+    return digest.hexdigest()
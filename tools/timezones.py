@@ -0,0 +1,60 @@
+import json
+import os
+from functools import lru_cache
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+TIMEZONE_CACHE_PATH: Path = Path("data/cache/timezones.json")
+
+_finder = None
+_cache: dict[str, str] | None = None
+_dirty: bool = False
+
+
+def _timezone_finder():
+    # Loading the polygon data takes seconds, so one finder is shared by the whole process
+    global _finder
+    if _finder is None:
+        from timezonefinder import TimezoneFinder
+        _finder = TimezoneFinder()
+    return _finder
+
+
+@lru_cache(maxsize=4096)
+def timezone_at(lat: float, lon: float):
+    return _timezone_finder().timezone_at(lat=lat, lng=lon) or "UTC"  # No zone at sea
+
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        _cache = json.load(open(TIMEZONE_CACHE_PATH)) if TIMEZONE_CACHE_PATH.exists() else {}
+    return _cache
+
+
+def save_timezone_cache():
+    global _dirty
+    if not _dirty: return
+
+    # Merge with entries other processes may have written in the meantime
+    cache = json.load(open(TIMEZONE_CACHE_PATH)) if TIMEZONE_CACHE_PATH.exists() else {}
+    cache.update(_load_cache())
+
+    TIMEZONE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = TIMEZONE_CACHE_PATH.with_suffix(f".{os.getpid()}.tmp")
+    with open(temp_path, "w") as file:
+        json.dump(cache, file, indent=2, sort_keys=True)
+    os.replace(temp_path, TIMEZONE_CACHE_PATH)
+    _dirty = False
+
+
+def resolve_timezone(callsign: str, lat: float, lon: float):
+    global _dirty
+    lat, lon = round(lat, 2), round(lon, 2)
+    key = f"{callsign}@{lat:.2f},{lon:.2f}"
+
+    cache = _load_cache()
+    if key not in cache:
+        cache[key] = timezone_at(lat, lon)
+        _dirty = True
+    return ZoneInfo(cache[key])
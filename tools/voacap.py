@@ -1,12 +1,34 @@
+import hashlib
+import math
+import os
+import shutil
 import subprocess
+import tempfile
+from functools import cache
+from multiprocessing import Pool
 from pathlib import Path
 
+from tools.profiling import span, count, take_profile, merge_profile
+from tools.voacap_extractor import build_index
+
 DATA_POINT_PATH: Path = Path("data/data/point")
+ITSHFBC_PATH: Path = Path.home() / "itshfbc"
+
+VOACAP_CACHE_PATH: Path = Path("data/cache/voacap")
+VOACAP_CACHE_MAX_BYTES: int = 512 * 1024 ** 2
+VOACAP_BATCH_SIZE: int = 16
 
-def run_voacap(MONTH, SSN, TX, RX, CIRCUIT, NOISE, POWER):
-    config = f"""\
+DECK_HEADER = """\
 LINEMAX    9999       number of lines-per-page
 COEFFS    CCIR
+"""
+DECK_FOOTER = "QUIT"
+
+_WORKER_ITSHFBC: Path = ITSHFBC_PATH
+
+
+def build_block(MONTH, SSN, TX, RX, CIRCUIT, NOISE, POWER):
+    return f"""\
 TIME          1   24    1    1
 MONTH      {MONTH}
 SUNSPOT    {SSN}
@@ -35,13 +57,149 @@ ANTENNA       2   18   26   30     0.000[default/isotrope     ]  0.0    0.0000
 FREQUENCY  1.84 3.60 5.30 7.1010.1014.1018.1021.1024.9028.20 50.29
 METHOD       30    0
 EXECUTE
-QUIT"""
-    config_path = Path.home() / "itshfbc/run/voacapx.dat"
-    output_path = Path.home() / "itshfbc/run/voacapx.out"
+"""
+
+
+def build_deck(MONTH, SSN, TX, RX, CIRCUIT, NOISE, POWER):
+    return DECK_HEADER + build_block(MONTH, SSN, TX, RX, CIRCUIT, NOISE, POWER) + DECK_FOOTER
+
+
+def split_output(output_path: Path):
+    with open(output_path, "rb") as file:
+        data = file.read()
+    return [data[run["start"]:run["end"]] for run in build_index(output_path)]
+
+
+@cache
+def voacapl_version():
+    try:
+        result = subprocess.run(["voacapl", "--version"], capture_output=True, text=True)
+        return result.stdout.strip() or result.stderr.strip()
+    except OSError:
+        return "unknown"
+
+
+def deck_key(deck: str):
+    return hashlib.sha256(f"{voacapl_version()}\n{deck}".encode()).hexdigest()
+
+
+def cache_get(key: str, output_path: Path):
+    cached = VOACAP_CACHE_PATH / f"{key}.out"
+    try:
+        shutil.copyfile(cached, output_path)
+        os.utime(cached)  # Mark as recently used
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def cache_put(key: str, output_path: Path):
+    VOACAP_CACHE_PATH.mkdir(parents=True, exist_ok=True)
+    temp_path = VOACAP_CACHE_PATH / f"{key}.{os.getpid()}.tmp"
+    shutil.copyfile(output_path, temp_path)
+    os.replace(temp_path, VOACAP_CACHE_PATH / f"{key}.out")
+
+
+def cache_evict(max_bytes: int = VOACAP_CACHE_MAX_BYTES):
+    entries = []
+    for path in VOACAP_CACHE_PATH.glob("*.out"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes: break
+        path.unlink(missing_ok=True)
+        total -= size
 
-    config_path.write_text(config)
-    subprocess.run(["voacapl", str(Path.home() / "itshfbc")], check=True)
 
+def _output_path(MONTH, TX, RX):
     path = DATA_POINT_PATH / f"{TX}_{RX}" / f"{MONTH.replace(" ", "_")}"
     path.mkdir(parents=True, exist_ok=True)
-    output_path.rename(path / "voacapx.out")
+    return path / "voacapx.out"
+
+
+def _from_cache(job):
+    MONTH, _, TX, RX, *_ = job
+    return cache_get(deck_key(build_deck(*job)), _output_path(MONTH, TX, RX))
+
+
+def run_voacap_batch(jobs: list, itshfbc: Path = ITSHFBC_PATH, quiet: bool = False):
+    jobs = [job for job in jobs if not _from_cache(job)]
+    if not jobs: return
+
+    config_path = itshfbc / "run/voacapx.dat"
+    output_path = itshfbc / "run/voacapx.out"
+
+    config_path.write_text(DECK_HEADER + "".join(build_block(*job) for job in jobs) + DECK_FOOTER)
+    with span("voacap", circuits=[f"{TX}_{RX}/{MONTH}" for MONTH, _, TX, RX, *_ in jobs]):
+        subprocess.run(["voacapl", str(itshfbc)], check=True, stdout=subprocess.DEVNULL if quiet else None)
+    count("voacap_runs")
+    count("voacap_circuits", len(jobs))
+
+    runs = split_output(output_path)
+    if len(runs) != len(jobs):
+        raise RuntimeError(f"VOACAP returned {len(runs)} runs for a batch of {len(jobs)} circuits")
+
+    for job, run in zip(jobs, runs):
+        MONTH, _, TX, RX, *_ = job
+        path = _output_path(MONTH, TX, RX)
+        path.write_bytes(run)
+        cache_put(deck_key(build_deck(*job)), path)
+    output_path.unlink()
+
+
+def run_voacap(MONTH, SSN, TX, RX, CIRCUIT, NOISE, POWER, itshfbc: Path = ITSHFBC_PATH, quiet: bool = False):
+    run_voacap_batch([(MONTH, SSN, TX, RX, CIRCUIT, NOISE, POWER)], itshfbc, quiet)
+
+
+def make_worker_itshfbc(root: Path, name: str):
+    # Overlay of the shared itshfbc tree: everything is symlinked except run/, which voacapl writes to
+    itshfbc = root / name
+    itshfbc.mkdir(parents=True, exist_ok=True)
+    for entry in ITSHFBC_PATH.iterdir():
+        if entry.name == "run":
+            shutil.copytree(entry, itshfbc / "run", dirs_exist_ok=True)
+        elif not (itshfbc / entry.name).exists():
+            (itshfbc / entry.name).symlink_to(entry.resolve(), target_is_directory=entry.is_dir())
+    return itshfbc
+
+
+def _init_worker(root: Path):
+    global _WORKER_ITSHFBC
+    take_profile()  # Drop the spans and counters of the parent that came along with the fork
+    _WORKER_ITSHFBC = make_worker_itshfbc(root, f"worker_{os.getpid()}")
+
+
+def _run_worker(batch):
+    run_voacap_batch(batch, itshfbc=_WORKER_ITSHFBC, quiet=True)
+    return batch, take_profile()
+
+
+def run_voacap_pool(jobs: list, workers: int = os.cpu_count(), batch_size: int = VOACAP_BATCH_SIZE):
+    jobs = [job for job in jobs if not _from_cache(job)]
+    if not jobs: return
+    workers = max(1, min(workers, len(jobs)))
+
+    # Many circuits share one voacapl start-up, but never so many that a core is left idle
+    size = max(1, min(batch_size, math.ceil(len(jobs) / workers)))
+    batches = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+    if workers == 1:
+        for batch in batches:
+            run_voacap_batch(batch)
+    else:
+        root = Path(tempfile.mkdtemp(prefix="itshfbc_"))
+        try:
+            with Pool(workers, initializer=_init_worker, initargs=(root,)) as pool:
+                for batch, profile in pool.imap(_run_worker, batches):
+                    merge_profile(profile)
+                    for MONTH, _, TX, RX, *_ in batch:
+                        print(f" VOACAP done: {TX} - {RX} [{MONTH}]")
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    # Once per run, the workers only add to the cache
+    cache_evict()
@@ -1,5 +1,14 @@
+import json
+import mmap
+from functools import lru_cache
 from pathlib import Path
 
+import numpy as np
+
+from tools.profiling import span
+
+INDEX_SUFFIX = ".idx.json"
+
 
 def get_band(filepath: Path):
     with open(filepath) as file:
@@ -12,37 +21,143 @@ def get_band(filepath: Path):
         return [int(float(x)) for x in parts[2:-1] if int(float(x)) != 0]
 
 
-def get_values(field: str, filepath: Path):
-    data = []
+def _to_float(x: str):
+    try:
+        return float(x)
+    except ValueError:
+        return np.nan  # '-' and MODE entries such as '1F2'
 
-    with open(filepath) as file:
-        while True:
-            for line in file:
-                line = line.strip()
-                if line.endswith("FREQ"):
-                    break
-            else:
-                break  # EOF
-            parts = line.split()
-
-            hour = int(float(parts[0]))
-            freqs = [int(float(x)) for x in parts[2:-1] if int(float(x)) != 0]
-
-            for line in file:
-                line = line.strip()
-                if line.endswith(field):
-                    break
-            else:
-                break  # EOF
-
-            line = line[:-len(field)].strip()
-            parts = line.split()
-
-            values = [float(x) for x in parts[1:] if x != '-']
-            for f, v in zip(freqs, values):
-                data.append({"hour": hour, "freq": f, "value": v})
 
-    return data
+def _freq_columns(parts: list[str]):
+    columns = [i for i, x in enumerate(parts[2:-1]) if int(float(x)) != 0]
+    return columns, [int(float(parts[2 + i])) for i in columns]
+
+
+def _split_field(parts: list[str]):
+    # Field names are the trailing alphabetic tokens, e.g. "SNR", "SNR UP", "V HITE"
+    n = len(parts)
+    while n > 0 and parts[n - 1].isalpha():
+        n -= 1
+    return " ".join(parts[n:]), n
+
+
+def _row_values(parts: list[str], n: int, columns: list[int]):
+    values = [_to_float(x) for x in parts[1:n]]
+    return [values[i] if i < len(values) else np.nan for i in columns]
+
+
+def build_index(filepath: Path):
+    # Byte offsets of every EXECUTE block (run) and of the FREQ and field rows of each of its hours.
+    # Every run prints hours 1-24, each hour a FREQ row followed by its field rows up to a blank line,
+    # so a run ends after the hour block where the next FREQ row restarts the hour count.
+    runs = []
+    run = {"start": 0, "hours": {}}
+    offset, block_end, hour, in_block = 0, 0, None, False
+    with open(filepath, "rb") as file:
+        for line in file:
+            parts = line.decode("ascii", "replace").split()
+            if not parts:
+                if in_block: block_end = offset + len(line)
+                in_block = False
+            elif parts[-1] == "FREQ":
+                next_hour = int(float(parts[0]))
+                if hour is not None and next_hour <= hour:
+                    run["end"] = block_end
+                    runs.append(run)
+                    run = {"start": block_end, "hours": {}}
+                hour, in_block = next_hour, True
+                run["hours"][str(hour)] = {"FREQ": offset}
+            elif in_block:
+                field, n = _split_field(parts)
+                if n < len(parts): run["hours"][str(hour)].setdefault(field, offset)
+            offset += len(line)
+
+    run["end"] = offset
+    runs.append(run)
+    return runs
+
+
+def load_index(filepath: Path):
+    filepath = Path(filepath)
+    stat = filepath.stat()
+    index_path = filepath.with_name(filepath.name + INDEX_SUFFIX)
+    try:
+        with open(index_path) as file:
+            index = json.load(file)
+        if index["mtime_ns"] == stat.st_mtime_ns and index["size"] == stat.st_size:
+            return index["runs"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    runs = build_index(filepath)
+    try:
+        with open(index_path, "w") as file:
+            json.dump({"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "runs": runs}, file)
+    except OSError:
+        pass  # Read-only location, the index is rebuilt next time
+    return runs
+
+
+def _parse_lines(lines):
+    freqs: list[int] = []
+    columns: list[int] = []
+    fields: list[str] = []
+    rows: dict[tuple[int, str], list[float]] = {}
+
+    hour, in_block = None, False
+    for line in lines:
+        parts = line.split()
+        if not parts:
+            in_block = False
+            continue
+
+        if parts[-1] == "FREQ":
+            next_hour = int(float(parts[0]))
+            if hour is not None and next_hour <= hour: break  # Start of the next EXECUTE block
+            hour, in_block = next_hour, True
+            if not freqs: columns, freqs = _freq_columns(parts)
+            continue
+        if not in_block: continue
+
+        field, n = _split_field(parts)
+        if n == len(parts): continue
+        if field not in fields: fields.append(field)
+        rows[hour, field] = _row_values(parts, n, columns)
+
+    data = np.full((24, len(freqs), len(fields)), np.nan)
+    for (h, field), values in rows.items():
+        data[h % 24, :, fields.index(field)] = values  # VOACAP hour 24 is 00 UTC
+    data.setflags(write=False)
+    return freqs, fields, data
+
+
+@lru_cache(maxsize=64)
+def _parse(filepath: str, mtime_ns: int, size: int, run: int):
+    if size == 0: return _parse_lines([])
+    with span("parse", file=filepath, run=run):
+        runs = load_index(filepath)
+        with open(filepath, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            text = mm[runs[run]["start"]:runs[run]["end"]].decode("ascii", "replace")
+        return _parse_lines(text.splitlines())
+
+
+def parse_voacapx(filepath: Path, run: int = 0):
+    # Returns (freqs, fields, data) with data indexed as [UTC hour, freq, field]
+    stat = Path(filepath).stat()
+    return _parse(str(filepath), stat.st_mtime_ns, stat.st_size, run)
+
+
+def get_values(field: str, filepath: Path):
+    freqs, fields, data = parse_voacapx(filepath)
+    if field not in fields: return []
+    values = data[:, :, fields.index(field)]
+
+    return [
+        {"hour": hour, "freq": f, "value": float(values[hour % 24, i])}
+        for hour in range(1, 25)
+        for i, f in enumerate(freqs)
+        if not np.isnan(values[hour % 24, i])
+    ]
 
 
 def extract(field: str, filepath: Path, hour: int = None, band: int = None):
@@ -0,0 +1,82 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from tools.voacap_extractor import parse_voacapx
+
+DATA_POINT_PATH: Path = Path("data/data/point")
+PREDICTION_STORE_PATH: Path = Path("data/data/voacap")
+
+
+def write_prediction_store():
+    # One float64 array indexed as [circuit, month, UTC hour, freq, field], NaN where a circuit-month is missing
+    parsed = [
+        (path.parent.parent.name, path.parent.name, *parse_voacapx(path))
+        for path in sorted(DATA_POINT_PATH.glob("*/*/voacapx.out"))
+    ]
+
+    circuits = sorted({circuit for circuit, *_ in parsed})
+    months = sorted({month for _, month, *_ in parsed})
+    freqs = sorted({f for *_, freqs, _, _ in parsed for f in freqs})
+    fields = list(dict.fromkeys(field for *_, fields, _ in parsed for field in fields))
+
+    PREDICTION_STORE_PATH.mkdir(parents=True, exist_ok=True)
+    temp_path = PREDICTION_STORE_PATH / f"values.{os.getpid()}.npy"
+    values = np.lib.format.open_memmap(
+        temp_path, mode="w+", dtype=np.float64,
+        shape=(len(circuits), len(months), 24, len(freqs), len(fields))
+    )
+    values[:] = np.nan
+    for circuit, month, f, fi, data in parsed:
+        block = values[circuits.index(circuit), months.index(month)]
+        block[np.ix_(range(24), [freqs.index(x) for x in f], [fields.index(x) for x in fi])] = data
+    values.flush()
+    del values
+
+    # present: the freqs each circuit-month was simulated on, the others are NaN columns of the array
+    index = {
+        "circuits": circuits, "months": months, "freqs": freqs, "fields": fields,
+        "present": {f"{circuit}/{month}": f for circuit, month, f, _, _ in parsed},
+    }
+    index_path = PREDICTION_STORE_PATH / f"index.{os.getpid()}.tmp"
+    with open(index_path, "w") as file:
+        json.dump(index, file, indent=2)
+    os.replace(temp_path, PREDICTION_STORE_PATH / "values.npy")
+    os.replace(index_path, PREDICTION_STORE_PATH / "index.json")
+
+
+def _read_prediction_store():
+    try:
+        with open(PREDICTION_STORE_PATH / "index.json") as file:
+            index = json.load(file)
+        values = np.load(PREDICTION_STORE_PATH / "values.npy", mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+
+    # A run stopped between the two renames leaves an index that does not describe the array
+    shape = tuple(len(index.get(key, [])) for key in ("circuits", "months")) + (24,) + \
+        tuple(len(index.get(key, [])) for key in ("freqs", "fields"))
+    if "present" not in index or values.shape != shape: return None
+    return index, values
+
+
+def load_prediction_store():
+    store = _read_prediction_store()
+    if store is None:
+        write_prediction_store()
+        store = _read_prediction_store()
+    return store
+
+
+def get_prediction(store, circuit: str, month: str):
+    index, values = store
+    present = index["present"].get(f"{circuit}/{month}")
+    if present is None:
+        return parse_voacapx(DATA_POINT_PATH / circuit / month / "voacapx.out")
+
+    # Only the freqs of this circuit-month, bands it was never simulated on would be plotted as NaN
+    columns = [index["freqs"].index(f) for f in present]
+    data = values[index["circuits"].index(circuit), index["months"].index(month)][:, columns]
+    return present, index["fields"], data
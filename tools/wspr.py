@@ -1,80 +1,354 @@
+import asyncio
+import calendar
+import hashlib
 import json
-from datetime import datetime
-from itertools import groupby
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
 from zoneinfo import ZoneInfo
 
 import httpx
+import numpy as np
 from dateutil.relativedelta import relativedelta
 
+from tools.profiling import count
+
 
 # BANDS = ["0", "1", "3", "5", "7", "10", "14", "18", "21", "24", "28", "50", "70", "144", "432", "1296", "-1"]
 
+WSPRLIVE_URL: str = os.environ.get("WSPRLIVE_URL", "https://db1.wspr.live/")
+WSPRLIVE_CONCURRENCY: int = 8
+WSPRLIVE_RETRIES: int = 4
+WSPRLIVE_BACKOFF: float = 0.5  # Seconds, doubled on every retry
+WSPRLIVE_SETTLE: timedelta = timedelta(days=2)  # Late uploads still land in a month this long after it ends
 
-def wsprlive_get(query, client=httpx.Client(http2=True, timeout=None)):
-    url = "https://db1.wspr.live/"
-    params = {"query": query + " FORMAT JSON"}
+SPOT_CACHE_PATH: Path = Path("data/cache/spots")
+QUERY_CACHE_PATH: Path = Path("data/cache/queries")
 
-    response = client.get(url, params=params)
-    response.raise_for_status()
-    json_obj = response.json()
+# Raw response bodies are saved here when set, for replay through tools.wsprlive_mock
+WSPRLIVE_RECORD_PATH: str | None = os.environ.get("WSPRLIVE_RECORD_PATH")
 
-    if "exception" in json_obj: print(f" \033[91m{json_obj["exception"]}\033[0m")
+# Per stage and per query hash: count, seconds, bytes and rows
+WSPRLIVE_STATS: dict[str, dict] = {}
+
+# RowBinary layout of spot queries, every column is cast server side so the wire layout is fixed. ClickHouse
+# resolves SELECT aliases in WHERE as well, so the epoch cast must not be called time or the time window breaks
+SPOT_DTYPE = np.dtype([("epoch", "<u4"), ("band", "<i2"), ("frequency", "<u4"), ("snr", "i1"), ("power", "i1")])
+SPOT_COLUMNS = ("toUInt32(time) AS epoch, toInt16(band) AS band, toUInt32(frequency) AS frequency, "
+                "toInt8(snr) AS snr, toInt8(power) AS power")
+
+# Band files on disk, time as UTC epoch seconds, memory-mappable with np.load(path, mmap_mode="r")
+BAND_DTYPE = np.dtype([("time", "<i8"), ("snr", "i1"), ("band", "<i2"), ("frequency", "<u4"), ("power", "i1")])
+
+# Server side aggregation: one row per band, UTC hour and SNR value with its spot count
+HOURLY_DTYPE = np.dtype([("band", "<i2"), ("hour", "u1"), ("snr", "i1"), ("n", "<u4")])
+
+
+def _params(query, dtype: np.dtype = None):
+    return {"query": query + (" FORMAT JSON" if dtype is None else " FORMAT RowBinary")}
+
+
+def query_hash(query: str):
+    return hashlib.sha1(query.encode()).hexdigest()
+
+
+def _record(stage: str, query: str, response: httpx.Response, result, seconds: float):
+    rows = len(next(iter(result.values()), [])) if isinstance(result, dict) else len(result)
+    key = query_hash(query)[:12]
+
+    stats = WSPRLIVE_STATS.setdefault(stage, {"queries": 0, "seconds": 0.0, "bytes": 0, "rows": 0, "hashes": {}})
+    per_query = stats["hashes"].setdefault(key, {"queries": 0, "seconds": 0.0, "bytes": 0, "rows": 0})
+    for entry in (stats, per_query):
+        entry["queries"] += 1
+        entry["seconds"] += seconds
+        entry["bytes"] += len(response.content)
+        entry["rows"] += rows
+
+    if WSPRLIVE_RECORD_PATH:
+        record_path = Path(WSPRLIVE_RECORD_PATH)
+        record_path.mkdir(parents=True, exist_ok=True)
+        (record_path / f"{query_hash(response.request.url.params["query"])}.bin").write_bytes(response.content)
+
+
+def merge_wsprlive_stats(other: dict):
+    # Folds in the stats a worker process collected
+    for stage, stats in other.items():
+        merged = WSPRLIVE_STATS.setdefault(stage, {"queries": 0, "seconds": 0.0, "bytes": 0, "rows": 0, "hashes": {}})
+        for key, per_query in [(None, stats)] + list(stats["hashes"].items()):
+            entry = merged if key is None else merged["hashes"].setdefault(
+                key, {"queries": 0, "seconds": 0.0, "bytes": 0, "rows": 0})
+            for name in ("queries", "seconds", "bytes", "rows"):
+                entry[name] += per_query[name]
+
+
+def wsprlive_report():
+    print(f" {"Stage":<10}{"Queries":>9}{"Seconds":>10}{"MiB":>9}{"Rows":>11}")
+    for stage, stats in WSPRLIVE_STATS.items():
+        print(f" {stage:<10}{stats["queries"]:>9}{stats["seconds"]:>10.2f}"
+              f"{stats["bytes"] / 1024 ** 2:>9.2f}{stats["rows"]:>11}")
+    return WSPRLIVE_STATS
+
+
+def _decode(response: httpx.Response, dtype: np.dtype = None):
+    if dtype is not None:
+        if len(response.content) % dtype.itemsize:
+            raise RuntimeError(f"Malformed RowBinary response: {response.content[-200:]!r}")
+        rows = np.frombuffer(response.content, dtype=dtype)
+        return {("time" if name == "epoch" else name): rows[name].astype(np.int64) if name == "epoch" else rows[name]
+                for name in dtype.names}
 
+    json_obj = response.json()
+    if "exception" in json_obj: print(f" \033[91m{json_obj["exception"]}\033[0m")
     return json_obj["data"]
 
 
+def wsprlive_get(query, client=httpx.Client(http2=True, timeout=None), url: str = None, dtype: np.dtype = None,
+                 stage: str = "query"):
+    start = time.perf_counter()
+    response = client.get(url or WSPRLIVE_URL, params=_params(query, dtype))
+    response.raise_for_status()
+    seconds = time.perf_counter() - start
+
+    result = _decode(response, dtype)
+    _record(stage, query, response, result, seconds)
+    return result
+
+
+def _retryable(error: Exception):
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+async def wsprlive_aget(query, client: httpx.AsyncClient, url: str = None, dtype: np.dtype = None,
+                        retries: int = WSPRLIVE_RETRIES, stage: str = "query"):
+    for attempt in range(retries + 1):
+        try:
+            start = time.perf_counter()
+            response = await client.get(url or WSPRLIVE_URL, params=_params(query, dtype))
+            response.raise_for_status()
+            seconds = time.perf_counter() - start
+
+            result = _decode(response, dtype)
+            _record(stage, query, response, result, seconds)
+            return result
+        except httpx.HTTPError as error:
+            if attempt == retries or not _retryable(error): raise
+            await asyncio.sleep(WSPRLIVE_BACKOFF * 2 ** attempt)
+
+
+def month_closed(current_datetime):
+    return current_datetime + relativedelta(months=1) + WSPRLIVE_SETTLE <= datetime.now(ZoneInfo("UTC"))
+
+
+def wsprlive_get_cached(current_datetime, query, stage: str = "query"):
+    # Results about a closed month can never change, so they are served from disk once fetched
+    if not month_closed(current_datetime): return wsprlive_get(query, stage=stage)
+
+    file_path = QUERY_CACHE_PATH / f"{query_hash(query)}.json"
+    if file_path.exists():
+        with open(file_path) as file:
+            return json.load(file)
+
+    json_obj = wsprlive_get(query, stage=stage)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = file_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(temp_path, "w") as file:
+        json.dump(json_obj, file)
+    os.replace(temp_path, file_path)
+    return json_obj
+
+
+def _spot_cache_path(tx, rx, current_datetime, local_tz, hourly: bool = False):
+    name = f"{current_datetime.strftime("%Y-%m")}_{str(local_tz).replace("/", "∕")}{"_hourly" if hourly else ""}.npz"
+    return SPOT_CACHE_PATH / f"{tx}_{rx}".replace("/", "∕") / name
+
+
+def load_cached_spots(tx, rx, current_datetime, local_tz, hourly: bool = False):
+    file_path = _spot_cache_path(tx, rx, current_datetime, local_tz, hourly)
+    if not month_closed(current_datetime) or not file_path.exists(): return None
+    with np.load(file_path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def cache_spots(tx, rx, current_datetime, local_tz, columns, hourly: bool = False):
+    if not month_closed(current_datetime): return
+    file_path = _spot_cache_path(tx, rx, current_datetime, local_tz, hourly)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = file_path.with_name(f"{file_path.stem}.{os.getpid()}.tmp.npz")
+    np.savez(temp_path, **columns)
+    os.replace(temp_path, file_path)
+
+
 def wsprlive_get_info(circuit, current_datetime):
     start = current_datetime.strftime("%Y-%m-%d %H:%M:%S")
     end = (current_datetime + relativedelta(months=1)).strftime("%Y-%m-%d %H:%M:%S")
 
-    json_obj = wsprlive_get(
+    json_obj = wsprlive_get_cached(
+        current_datetime,
         f"SELECT tx_lat, tx_lon, rx_lat, rx_lon, power, distance "
         f"FROM rx "
         f"WHERE tx_sign = '{circuit['tx']}' AND rx_sign = '{circuit['rx']}' "
         f"AND '{start}' <= time AND time < '{end}' "
-        f"LIMIT 1")
+        f"LIMIT 1",
+        stage="info")
     return json_obj[0] if json_obj else {}
 
 
-def wsprlive_get_info_group(circuit, current_datetime, c_lat: float, c_lon: float, r_lat: float, r_lon: float):
+def wsprlive_get_receivers(tx, current_datetime):
+    # Every receiver that heard tx in the month, neighbors are then picked locally (see tools.geo). A receiver
+    # reported at several locations or powers comes back once per combination, earliest first
     start = current_datetime.strftime("%Y-%m-%d %H:%M:%S")
     end = (current_datetime + relativedelta(months=1)).strftime("%Y-%m-%d %H:%M:%S")
 
-    return wsprlive_get(
-        f"SELECT DISTINCT rx_sign, rx_lat, rx_lon, power "
+    return wsprlive_get_cached(
+        current_datetime,
+        f"SELECT rx_sign, rx_lat, rx_lon, power, min(time) AS first_seen "
         f"FROM rx "
-        f"WHERE tx_sign = '{circuit['tx']}' AND rx_sign != '{circuit['rx']}' "
-        f"AND abs(rx_lat - CAST({c_lat} AS Float32)) <= {r_lat} "
-        f"AND abs(rx_lon - CAST({c_lon} AS Float32)) <= {r_lon} "
-        f"AND '{start}' <= time AND time < '{end}'")
-
+        f"WHERE tx_sign = '{tx}' "
+        f"AND '{start}' <= time AND time < '{end}' "
+        f"GROUP BY rx_sign, rx_lat, rx_lon, power "
+        f"ORDER BY rx_sign, first_seen",
+        stage="group")
 
-def wsprlive_pull_one_month(tx, rx, current_datetime, local_tz, prefix_path, suffix_path: str = ""):
-    print(f" Pulling: {tx} - {rx}")
 
+def _pull_query(tx, rx, current_datetime, local_tz):
     local_datetime = current_datetime.astimezone(local_tz)
     start = local_datetime.strftime("%Y-%m-%d %H:%M:%S")
     end = (local_datetime + relativedelta(months=1)).strftime("%Y-%m-%d %H:%M:%S")
 
-    json_obj = wsprlive_get(
-        f"SELECT time, band, frequency, snr, power "
+    return (
+        f"SELECT {SPOT_COLUMNS} "
         f"FROM rx "
         f"WHERE tx_sign = '{tx}' AND rx_sign = '{rx}' "
         f"AND '{start}' <= time "
         f"AND time < '{end}' "
         f"ORDER BY band, time ASC")
 
+
+def _hourly_query(tx, rx, current_datetime, local_tz):
+    local_datetime = current_datetime.astimezone(local_tz)
+    start = local_datetime.strftime("%Y-%m-%d %H:%M:%S")
+    end = (local_datetime + relativedelta(months=1)).strftime("%Y-%m-%d %H:%M:%S")
+
+    # Same local wall clock to UTC shift as the raw pull, done before taking the hour
+    return (
+        f"SELECT toInt16(band) AS band, toUInt8(toHour(toDateTime(toString(time), '{local_tz}'), 'UTC')) AS hour, "
+        f"toInt8(snr) AS snr, toUInt32(count()) AS n "
+        f"FROM rx "
+        f"WHERE tx_sign = '{tx}' AND rx_sign = '{rx}' "
+        f"AND '{start}' <= time "
+        f"AND time < '{end}' "
+        f"GROUP BY band, hour, snr "
+        f"ORDER BY band, hour, snr ASC")
+
+
+def _local_to_utc(times: np.ndarray, local_tz):
+    # Spot times are read as local wall clock and shifted to UTC, one offset lookup per distinct hour
+    if getattr(local_tz, "key", None) == "UTC" or not len(times): return times
+
+    hours, inverse = np.unique(times // 3600, return_inverse=True)
     utc_tz = ZoneInfo("UTC")
-    for entry in json_obj:
-        entry["time"] = (
-            datetime.strptime(entry["time"], "%Y-%m-%d %H:%M:%S")
-            .replace(tzinfo=local_tz)
-            .astimezone(utc_tz)
-            .strftime("%Y-%m-%d %H:%M:%S")
-        )
-
-    for band, group in groupby(json_obj, lambda e: e["band"]):
+    offsets = np.array([
+        datetime.fromtimestamp(int(h) * 3600, utc_tz).replace(tzinfo=local_tz).utcoffset().total_seconds()
+        for h in hours
+    ], dtype=np.int64)
+    return times - offsets[inverse]
+
+
+def _write_bands(columns, local_tz, prefix_path, suffix_path: str = "", json_export: bool = False):
+    columns["time"] = _local_to_utc(columns["time"], local_tz)
+    spots = np.empty(len(columns["time"]), dtype=BAND_DTYPE)
+    for name in BAND_DTYPE.names:
+        spots[name] = columns[name]
+
+    bands, starts = np.unique(spots["band"], return_index=True)  # Rows arrive ordered by band
+    for band, s, e in zip(bands, starts, list(starts[1:]) + [len(spots)]):
+        full_path = prefix_path / f"{band:02d}{suffix_path}.npy"
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        np.save(full_path, spots[s:e])
+        count("spot_files")
+        count("spot_rows", int(e - s))
+
+        if json_export:
+            times = np.char.replace(np.datetime_as_string(spots["time"][s:e].astype("datetime64[s]")), "T", " ")
+            with open(full_path.with_suffix(".json"), "w") as file:
+                json.dump([
+                    {"time": str(t), "band": int(b), "frequency": int(f), "snr": int(snr), "power": int(p)}
+                    for t, (_, snr, b, f, p) in zip(times, spots[s:e].tolist())
+                ], file, indent=2)
+
+
+def _write_hourly(columns, current_datetime, prefix_path, suffix_path: str = ""):
+    (_, days_count) = calendar.monthrange(current_datetime.year, current_datetime.month)
+
+    bands, starts = np.unique(columns["band"], return_index=True)  # Rows arrive ordered by band
+    for band, s, e in zip(bands, starts, list(starts[1:]) + [len(columns["band"])]):
+        hours = [[] for _ in range(24)]
+        for hour, snr, n in zip(columns["hour"][s:e], columns["snr"][s:e], columns["n"][s:e]):
+            hours[hour].append([int(snr), int(n)])
+
         full_path = prefix_path / f"{band:02d}{suffix_path}.json"
         full_path.parent.mkdir(parents=True, exist_ok=True)
         with open(full_path, "w") as file:
-            json.dump(list(group), file, indent=2)
+            json.dump({"days": days_count, "samples": int(columns["n"][s:e].sum()), "hours": hours}, file)
+        count("spot_files")
+        count("spot_rows", int(e - s))
+
+
+def wsprlive_pull_hourly_one_month(tx, rx, current_datetime, local_tz, prefix_path, suffix_path: str = ""):
+    # Band files hold per hour SNR histograms instead of raw spots, read by plots._read_hours through plots._summary_hours
+    print(f" Pulling hourly summary: {tx} - {rx}")
+
+    columns = load_cached_spots(tx, rx, current_datetime, local_tz, hourly=True)
+    if columns is None:
+        columns = wsprlive_get(_hourly_query(tx, rx, current_datetime, local_tz), dtype=HOURLY_DTYPE, stage="hourly")
+        cache_spots(tx, rx, current_datetime, local_tz, columns, hourly=True)
+    _write_hourly(columns, current_datetime, prefix_path, suffix_path)
+
+
+def wsprlive_pull_one_month(tx, rx, current_datetime, local_tz, prefix_path, suffix_path: str = "",
+                            json_export: bool = False):
+    print(f" Pulling: {tx} - {rx}")
+
+    columns = load_cached_spots(tx, rx, current_datetime, local_tz)
+    if columns is None:
+        columns = wsprlive_get(_pull_query(tx, rx, current_datetime, local_tz), dtype=SPOT_DTYPE, stage="spots")
+        cache_spots(tx, rx, current_datetime, local_tz, columns)
+    _write_bands(columns, local_tz, prefix_path, suffix_path, json_export)
+
+
+async def wsprlive_apull(pulls: list, concurrency: int = WSPRLIVE_CONCURRENCY, url: str = None,
+                         hourly: bool = False, json_export: bool = False):
+    # pulls are wsprlive_pull_one_month argument tuples, fetched concurrently and written in the given order
+    semaphore = asyncio.Semaphore(concurrency)
+    make_query, dtype = (_hourly_query, HOURLY_DTYPE) if hourly else (_pull_query, SPOT_DTYPE)
+
+    async with httpx.AsyncClient(http2=True, timeout=None) as client:
+        async def fetch(tx, rx, current_datetime, local_tz, *_):
+            columns = load_cached_spots(tx, rx, current_datetime, local_tz, hourly)
+            if columns is not None: return columns
+
+            async with semaphore:
+                query = make_query(tx, rx, current_datetime, local_tz)
+                columns = await wsprlive_aget(query, client, url, dtype, stage="hourly" if hourly else "spots")
+            cache_spots(tx, rx, current_datetime, local_tz, columns, hourly)
+            return columns
+
+        tasks = [asyncio.create_task(fetch(*pull)) for pull in pulls]
+        try:
+            for (tx, rx, current_datetime, local_tz, prefix_path, *suffix_path), task in zip(pulls, tasks):
+                print(f" Pulling{" hourly summary" if hourly else ""}: {tx} - {rx}")
+                if hourly:
+                    _write_hourly(await task, current_datetime, prefix_path, *suffix_path)
+                else:
+                    _write_bands(await task, local_tz, prefix_path, *suffix_path, json_export=json_export)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def wsprlive_pull_many(pulls: list, concurrency: int = WSPRLIVE_CONCURRENCY, url: str = None, hourly: bool = False,
+                       json_export: bool = False):
+    asyncio.run(wsprlive_apull(pulls, concurrency, url, hourly, json_export))
@@ -0,0 +1,181 @@
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+# Local stand-in for the wspr.live ClickHouse HTTP endpoint. Queries are answered from recordings made with
+# WSPRLIVE_RECORD_PATH when one matches, otherwise from synthetic rx table rows seeded by the query text.
+# Usage: python -m tools.wsprlive_mock --port 8123, then WSPRLIVE_URL=http://127.0.0.1:8123/ python main.py
+
+BANDS = [1, 3, 5, 7, 10, 14, 18, 21, 24, 28]
+RECEIVERS = 40  # Size of the synthetic receiver pool, each with a fixed location and power
+CASTS = {"toUInt32": "<u4", "toInt16": "<i2", "toInt8": "i1", "toUInt8": "u1"}
+
+
+def _columns(query: str):
+    select = re.search(r"SELECT\s+(?:DISTINCT\s+)?(.*?)\s+FROM\s", query, re.S).group(1)
+    columns, depth, part = [], 0, ""
+    for c in select + ",":
+        if c == "," and depth == 0:
+            part = part.strip()
+            alias = re.search(r"\s+AS\s+(\w+)$", part)
+            cast = re.match(r"(\w+)\(", part)
+            columns.append((alias.group(1) if alias else part, CASTS.get(cast.group(1)) if cast else None))
+            part = ""
+            continue
+        depth += (c == "(") - (c == ")")
+        part += c
+    return columns
+
+
+def _check(query: str):
+    # Like ClickHouse, SELECT aliases apply in WHERE too: a column cast to a number under its own name can no longer
+    # be compared with a datetime string
+    where = re.search(r"\sWHERE\s(.*?)(?:\sGROUP BY|\sORDER BY|\sLIMIT|$)", query, re.S)
+    if not where: return None
+    for cast, alias in re.findall(r"(\w+)\([^()]*\)\s+AS\s+(\w+)", query):
+        if cast in CASTS and re.search(rf"'[^']*'\s*[<>=]+\s*{alias}\b|\b{alias}\s*[<>=]+\s*'", where.group(1)):
+            return (f"Code: 53. DB::Exception: Cannot convert string to type {cast[2:]} in the comparison with "
+                    f"alias {alias} in WHERE. (TYPE_MISMATCH)")
+    return None
+
+
+def _window(query: str):
+    utc_tz = ZoneInfo("UTC")
+    dates = re.findall(r"'(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)'", query)
+    if len(dates) < 2: return 1735689600, 1738368000
+    start, end = (int(datetime.strptime(d, "%Y-%m-%d %H:%M:%S").replace(tzinfo=utc_tz).timestamp()) for d in dates[:2])
+    return start, end
+
+
+def _synthetic(query: str, rows: int, seed: int):
+    rng = np.random.default_rng(int(hashlib.sha1(query.encode()).hexdigest()[:8], 16) ^ seed)
+    limit = re.search(r"LIMIT\s+(\d+)", query)
+    n = rows  # Before the time filter and LIMIT
+    start, end = _window(query)
+    # Spots are spread over a few days around the window and the WHERE time filter is applied to them
+    times = rng.integers(start - 2 * 86400, end + 2 * 86400, n)
+
+    pool = np.random.default_rng(seed)
+    pool_lat, pool_lon = pool.uniform(-60, 70, RECEIVERS).round(3), pool.uniform(-180, 180, RECEIVERS).round(3)
+    pool_power = pool.choice([23, 30, 37], RECEIVERS)
+    receiver = rng.integers(0, RECEIVERS, n)
+
+    generators = {
+        "rx_sign": lambda: np.array([f"MOCK{i}" for i in receiver]),
+        "rx_lat": lambda: pool_lat[receiver],
+        "rx_lon": lambda: pool_lon[receiver],
+        "power": lambda: pool_power[receiver],
+        "time": lambda: times,
+        "epoch": lambda: times,
+        "first_seen": lambda: times,
+        "band": lambda: rng.choice(BANDS, n),
+        "frequency": lambda: rng.integers(1_800_000, 28_300_000, n),
+        "snr": lambda: np.clip(rng.normal(-15, 8, n).round(), -30, 20).astype(int),
+        "hour": lambda: rng.integers(0, 24, n),
+        "n": lambda: rng.integers(1, 50, n),
+        "distance": lambda: rng.integers(10, 15000, n),
+    }
+    data = {}
+    for name, _ in _columns(query):
+        if name in generators: data[name] = generators[name]()
+        elif name.endswith("_lat"): data[name] = rng.uniform(-60, 70, n).round(3)
+        elif name.endswith("_lon"): data[name] = rng.uniform(-180, 180, n).round(3)
+        else: data[name] = rng.integers(0, 100, n)
+
+    inside = np.flatnonzero((start <= times) & (times < end))
+    inside = inside[np.argsort(times[inside], kind="stable")]  # Earliest first, so grouping keeps min(time)
+    data = {k: v[inside] for k, v in data.items()}
+    if limit: data = {k: v[:int(limit.group(1))] for k, v in data.items()}
+
+    group = re.search(r"GROUP BY\s+([\w\s,]+?)\s+ORDER BY", query)
+    if group or "DISTINCT" in query:
+        keys = [k.strip() for k in group.group(1).split(",")] if group else [k for k in data if k != "n"]
+        _, index = np.unique(np.stack([data[k].astype(str) for k in keys]), axis=1, return_index=True)
+        data = {k: v[np.sort(index)] for k, v in data.items()}
+
+    order = re.search(r"ORDER BY\s+([\w\s,]+?)(?:\s+ASC|\s+DESC)?(?:\s+LIMIT|\s*$)", query)
+    if order:
+        keys = [k.strip() for k in order.group(1).split(",") if k.strip() in data]
+        index = np.lexsort([data[k] for k in reversed(keys)])
+        data = {k: v[index] for k, v in data.items()}
+    return data
+
+
+def _encode(query: str, data: dict):
+    columns = _columns(query)
+    if query.rstrip().endswith("FORMAT RowBinary"):
+        dtype = np.dtype([(name, cast or "<i4") for name, cast in columns])
+        rows = np.zeros(len(next(iter(data.values()))), dtype=dtype)
+        for name, _ in columns:
+            rows[name] = data[name]
+        return rows.tobytes()
+
+    names = [name for name, _ in columns]
+    rows = [dict(zip(names, (v.item() for v in values))) for values in zip(*(data[k] for k in names))]
+    return json.dumps({"meta": [], "data": rows, "rows": len(rows)}).encode()
+
+
+def make_handler(replay_path: Path | None, rows: int, seed: int, latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        def _answer(self, query: str):
+            time.sleep(latency)
+            recording = replay_path / f"{hashlib.sha1(query.encode()).hexdigest()}.bin" if replay_path else None
+            error = _check(query)
+            if error:
+                body = error.encode()
+                self.send_response(400)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if recording and recording.exists():
+                body = recording.read_bytes()
+            else:
+                body = _encode(query, _synthetic(query.rsplit(" FORMAT ", 1)[0], rows, seed))
+
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._answer(parse_qs(urlparse(self.path).query)["query"][0])
+
+        def do_POST(self):
+            self._answer(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode())
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def serve(port: int = 8123, replay_path: Path | None = None, rows: int = 5000, seed: int = 0, latency: float = 0.0,
+          background: bool = False):
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(replay_path, rows, seed, latency))
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    print(f" Mock wspr.live listening on http://127.0.0.1:{server.server_port}/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the wspr.live ClickHouse endpoint")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--replay", type=Path, help="directory of responses recorded with WSPRLIVE_RECORD_PATH")
+    parser.add_argument("--rows", type=int, default=5000, help="synthetic rows per query")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    args = parser.parse_args()
+    serve(args.port, args.replay, args.rows, args.seed, args.latency)